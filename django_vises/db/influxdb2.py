@@ -1,15 +1,846 @@
+import atexit
+import hashlib
 import logging
+import math
+import numbers
+import os
+import queue
+import re
+import socket
+import threading
+import time
 import warnings
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Future
+from datetime import UTC, datetime
+from itertools import batched
+from pathlib import Path
+from typing import Any, Literal
 
 from influxdb_client.client.exceptions import InfluxDBError
+from influxdb_client.client.flux_table import FluxRecord
 from influxdb_client.client.influxdb_client import InfluxDBClient
+from influxdb_client.client.write.point import Point
 from influxdb_client.client.write_api import SYNCHRONOUS
 from urllib3.exceptions import ConnectTimeoutError, HTTPError, TimeoutError
 
 logger = logging.getLogger(__name__)
 
+# https://docs.influxdata.com/influxdb/v2/reference/syntax/line-protocol/#special-characters
+_MEASUREMENT_ESCAPE = str.maketrans(
+    {",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+_KEY_ESCAPE = str.maketrans(
+    {",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+_STRING_FIELD_ESCAPE = str.maketrans({'"': r"\"", "\\": r"\\"})
+
+_PRECISION_SCALE = {"s": 1, "ms": 1_000, "us": 1_000_000, "ns": 1_000_000_000}
+
+
+def _to_list(column: Sequence | Any) -> list:
+    # NumPy 数组通过 tolist() 一次性转换为 Python 原生类型
+    if hasattr(column, "tolist"):
+        return column.tolist()
+
+    return list(column)
+
+
+def _escape_key(value) -> str:
+    escaped = str(value).translate(_KEY_ESCAPE)
+    # 与 influxdb_client 一致, 结尾的反斜杠会转义其后的分隔符, 补一个空格
+    if escaped.endswith("\\"):
+        escaped += " "
+
+    return escaped
+
+
+def _format_field_value(value) -> str | None:
+    # NumPy 标量转换为 Python 原生类型, 否则会被当作字符串写入
+    if hasattr(value, "dtype") and hasattr(value, "item"):
+        value = value.item()
+
+    match value:
+        case None:
+            return None
+        case bool():
+            return "true" if value else "false"
+        case numbers.Integral():
+            return f"{int(value)}i"
+        case numbers.Real():
+            value = float(value)
+            # line protocol 不支持 NaN/Inf
+            return repr(value) if math.isfinite(value) else None
+        case _:
+            return f'"{str(value).translate(_STRING_FIELD_ESCAPE)}"'
+
+
+def _timestamp_to_int(value, precision: str) -> int:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=UTC)
+        delta = value - datetime(1970, 1, 1, tzinfo=UTC)
+        micro = (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+        return micro * _PRECISION_SCALE[precision] // 1_000_000
+
+    if hasattr(value, "dtype") and value.dtype.kind == "M":
+        # NumPy datetime64 标量, 按自身单位换算
+        return int(value.astype(f"datetime64[{precision}]").astype("int64"))
+
+    return int(value)
+
+
+def _timestamps_to_list(timestamps: Sequence | Any, precision: str) -> list:
+    # datetime64 数组的 tolist() 得到的是按自身单位计的整数(或 datetime), 先换算为 precision
+    if getattr(getattr(timestamps, "dtype", None), "kind", None) == "M":
+        return timestamps.astype(f"datetime64[{precision}]").astype("int64").tolist()
+
+    return _to_list(timestamps)
+
+
+def columns_to_line_protocol(
+    measurement: str,
+    tags: dict[str, Sequence],
+    fields: dict[str, Sequence],
+    timestamps: Sequence,
+    precision: Literal["s", "ms", "us", "ns"] = "ns",
+) -> bytes:
+    """将列式数据一次性转换为 line protocol
+
+    tags/fields 为 列名 -> 列数据(list 或 NumPy 数组), 各列长度与 timestamps 一致;
+    timestamps 为按 precision 计的整数, datetime 对象, 或 NumPy datetime64 数组;
+    值为 None 的 tag/field 会被跳过, 没有任何 field 的行会被跳过
+    """
+    if precision not in _PRECISION_SCALE:
+        raise ValueError(f"Unsupported precision: {precision}")
+
+    timestamps = _timestamps_to_list(timestamps, precision)
+    rows = len(timestamps)
+
+    tag_columns = list()
+    for key, column in sorted(tags.items()):
+        column = _to_list(column)
+        if len(column) != rows:
+            raise ValueError(f"Tag column {key} length mismatch")
+
+        # tag 基数通常较低, 缓存转义结果
+        escaped: dict[Any, str] = dict()
+        for value in column:
+            if value not in escaped:
+                escaped[value] = (
+                    ""
+                    if value is None or value == ""
+                    else f",{_escape_key(key)}={_escape_key(value)}"
+                )
+        tag_columns.append([escaped[value] for value in column])
+
+    field_columns = list()
+    for key, column in fields.items():
+        column = _to_list(column)
+        if len(column) != rows:
+            raise ValueError(f"Field column {key} length mismatch")
+
+        field_columns.append((_escape_key(key), column))
+
+    prefix = measurement.translate(_MEASUREMENT_ESCAPE)
+    lines = list()
+    for row in range(rows):
+        field_set = ",".join(
+            f"{key}={formatted}"
+            for key, column in field_columns
+            if (formatted := _format_field_value(column[row])) is not None
+        )
+        if not field_set:
+            continue
+
+        tag_set = "".join(column[row] for column in tag_columns)
+        lines.append(
+            f"{prefix}{tag_set} {field_set} {_timestamp_to_int(timestamps[row], precision)}"
+        )
+
+    return "\n".join(lines).encode("utf-8")
+
+
+def _value_kind(value) -> str:
+    match value:
+        case datetime():
+            return "M"
+        case bool():
+            return "b"
+        case int():
+            return "i"
+        case float():
+            return "f"
+        case _:
+            return "O"
+
+
+def _column_to_numpy(np, values: list):
+    """转换一个分块的一列, 全部为空时返回 None, 由 _concat_numpy 按其它分块的类型填充
+
+    类型由分块内所有的值决定(同一分块可能包含多个类型不同的 table):
+    整数与浮点混合为 float64, 其它类型混合为 object
+    """
+    kinds = {_value_kind(value) for value in values if value is not None}
+    if not kinds:
+        return None
+
+    has_null = any(value is None for value in values)
+    if kinds == {"M"}:
+        # NaT 在 datetime64 中以 int64 最小值表示
+        nat = np.iinfo(np.int64).min
+        return np.array(
+            [
+                nat if value is None else _timestamp_to_int(value, "ns")
+                for value in values
+            ],
+            dtype=np.int64,
+        ).view("datetime64[ns]")
+    if kinds == {"b"}:
+        return np.array(values, dtype=object if has_null else np.bool_)
+    if kinds == {"i"} and not has_null:
+        return np.array(values, dtype=np.int64)
+    if kinds <= {"i", "f"}:
+        return np.array(
+            [np.nan if value is None else value for value in values], dtype=np.float64
+        )
+
+    return np.array(values, dtype=object)
+
+
+def _concat_numpy(np, arrays: list, lengths: list[int]):
+    """合并各分块的一列, 数值类型统一为能容纳所有分块的类型(如 int64 与 float64 合并为 float64)"""
+    typed = [array for array in arrays if array is not None]
+    if not typed:
+        return np.full(sum(lengths), None, dtype=object)
+
+    try:
+        dtype = np.result_type(*(array.dtype for array in typed))
+    except TypeError:
+        dtype = np.dtype(object)
+
+    has_null_chunk = len(typed) < len(arrays)
+    if has_null_chunk:
+        match dtype.kind:
+            case "i" | "u":
+                dtype = np.dtype(np.float64)
+            case "b":
+                dtype = np.dtype(object)
+
+    match dtype.kind:
+        case "M":
+            fill = np.datetime64("NaT", "ns")
+        case "f":
+            fill = np.nan
+        case _:
+            fill = None
+
+    return np.concatenate(
+        [
+            (
+                np.full(length, fill, dtype=dtype)
+                if array is None
+                else array.astype(dtype, copy=False)
+            )
+            for array, length in zip(arrays, lengths)
+        ]
+    )
+
+
+class InfluxDBBackgroundWriter:
+    """后台线程批量写入
+
+    按数量(batch_size)或最大延迟(flush_interval 秒)触发写入;
+    队列满时的策略 backpressure:
+        block: 阻塞调用方直到队列有空位
+        drop_oldest: 丢弃队列中最早的数据
+        drop_newest: 丢弃新写入的数据
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[dict]], None],
+        batch_size: int = 1000,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 100_000,
+        backpressure: Literal["block", "drop_oldest", "drop_newest"] = "block",
+    ):
+        if backpressure not in ("block", "drop_oldest", "drop_newest"):
+            raise ValueError(f"Unsupported backpressure: {backpressure}")
+
+        self._write = write
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_queue_size = max_queue_size
+        self._backpressure = backpressure
+
+        self.dropped = 0
+
+        self._queue: deque[dict] = deque()
+        self._cond = threading.Condition()
+        self._writing = False
+        self._flushing = False
+        self._closed = False
+
+        self._thread = threading.Thread(
+            target=self._run, name="InfluxDBBackgroundWriter", daemon=True
+        )
+        self._thread.start()
+        # 进程退出时写入剩余的数据
+        atexit.register(self.close)
+
+    def put(self, data: dict | list[dict]):
+        points = data if isinstance(data, list) else [data]
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("InfluxDBBackgroundWriter is closed")
+
+            for point in points:
+                if len(self._queue) >= self._max_queue_size:
+                    match self._backpressure:
+                        case "block":
+                            # 先唤醒后台线程写入已有的数据, 否则可能互相等待
+                            self._cond.notify_all()
+                            self._cond.wait_for(
+                                lambda: len(self._queue) < self._max_queue_size
+                                or self._closed
+                            )
+                            if self._closed:
+                                raise RuntimeError("InfluxDBBackgroundWriter is closed")
+                        case "drop_oldest":
+                            self._queue.popleft()
+                            self.dropped += 1
+                        case "drop_newest":
+                            self.dropped += 1
+                            continue
+
+                self._queue.append(point)
+
+            self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """等待队列中的数据全部写入, 返回是否在 timeout 内完成"""
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            return self._cond.wait_for(
+                lambda: not self._queue and not self._writing, timeout=timeout
+            )
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+
+            self._closed = True
+            self._cond.notify_all()
+
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self._flush_interval
+                while (
+                    not self._closed
+                    and not self._flushing
+                    and len(self._queue) < self._batch_size
+                ):
+                    # 空队列时不计时, 直到有数据才开始计算最大延迟
+                    if not self._queue:
+                        deadline = time.monotonic() + self._flush_interval
+                        self._cond.wait()
+                        continue
+
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+
+                if not self._queue:
+                    if self._closed:
+                        return
+
+                    self._flushing = False
+                    continue
+
+                batch = [
+                    self._queue.popleft()
+                    for _ in range(min(self._batch_size, len(self._queue)))
+                ]
+                if not self._queue:
+                    self._flushing = False
+                self._writing = True
+                self._cond.notify_all()
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"InfluxDB background write error: {e}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+
+# 合并空白字符, 但保留字符串字面量中的内容
+_FLUX_QUERY_NORMALIZE = re.compile(r'("(?:[^"\\]|\\.)*")|\s+')
+
+
+def _normalize_query(q: str) -> str:
+    return _FLUX_QUERY_NORMALIZE.sub(lambda m: m.group(1) or " ", q).strip()
+
+
+class InfluxDBQueryCache:
+    """query_with_columns 的结果缓存
+
+    以规范化后的查询语句与列名为 key, 进程内为 maxsize 条的 LRU, ttl 秒后过期;
+    相同的查询同时进行时, 只有一个请求访问 InfluxDB, 其他请求等待并共享结果;
+    指定 django_cache_alias 时, 结果同时保存在 Django cache 中, 在多个 worker 间共享
+    """
+
+    def __init__(
+        self,
+        ttl: float = 10,
+        maxsize: int = 256,
+        django_cache_alias: str | None = None,
+        key_prefix: str = "vises:influxdb:query:",
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.django_cache_alias = django_cache_alias
+        self.key_prefix = key_prefix
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, tuple[list, float]] = OrderedDict()
+        self._in_flight: dict[str, Future] = dict()
+
+    def _key(self, q: str, cs: list[str]) -> str:
+        raw = "\x00".join([_normalize_query(q), *cs])
+        return self.key_prefix + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _django_cache(self):
+        from django.core.cache import caches
+
+        return caches[self.django_cache_alias]
+
+    def get_or_query(self, q: str, cs: list[str], query: Callable[[], list]) -> list:
+        key = self._key(q, cs)
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._data.get(key)
+            if cached is not None and now < cached[1]:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return [row.copy() for row in cached[0]]
+
+            future = self._in_flight.get(key)
+            if future is None:
+                leader = True
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            return [row.copy() for row in future.result()]
+
+        try:
+            value = None
+            if self.django_cache_alias is not None:
+                value = self._django_cache().get(key)
+
+            if value is None:
+                with self._lock:
+                    self.misses += 1
+                value = query()
+                if self.django_cache_alias is not None:
+                    self._django_cache().set(key, value, timeout=self.ttl)
+            else:
+                with self._lock:
+                    self.hits += 1
+
+            with self._lock:
+                self._data[key] = (value, time.monotonic() + self.ttl)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+        return [row.copy() for row in value]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self._data),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _to_line_protocol(data: bytes | str | dict | list[dict]) -> bytes:
+    match data:
+        case bytes():
+            return data
+        case str():
+            return data.encode("utf-8")
+        case dict():
+            return Point.from_dict(data).to_line_protocol().encode("utf-8")
+        case _:
+            return b"\n".join(_to_line_protocol(item) for item in data)
+
+
+def _is_retryable(e: Exception) -> bool:
+    """连接/超时错误与 5xx/429 响应可重试, 其它 4xx 响应(格式错误、鉴权、字段类型冲突等)重试也不会成功"""
+    status = getattr(e, "status", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = getattr(e.response, "status", None)
+
+    return status is None or status == 429 or status >= 500
+
+
+class InfluxDBSpool:
+    """写入失败数据的磁盘暂存与重放
+
+    失败的数据以 line protocol 追加到 path 目录下的分段文件中, 单个分段最大 segment_bytes,
+    总大小超过 max_bytes 时丢弃最早的分段; 后台线程按指数退避(min_backoff ~ max_backoff 秒)重放.
+    写入失败后 healthy 为 False, 此时新的数据直接进入暂存, 调用方不再等待 InfluxDB 超时,
+    直到暂存的数据全部重放成功.
+    InfluxDB 对相同 series 与时间戳的数据点是覆盖写入, 重放失败时整段重试不会产生重复数据.
+    重放时被拒绝(4xx)的分段重命名为 *.rejected 隔离, 不再重试, 也不阻塞之后的分段.
+    每个进程需要使用独立的目录
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_bytes: int = 256 * 1024 * 1024,
+        segment_bytes: int = 8 * 1024 * 1024,
+        min_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.healthy = True
+        self.dropped_bytes = 0
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._current: Path | None = None
+        self._replaying: Path | None = None
+        self._sequence = time.time_ns()
+        self._thread: threading.Thread | None = None
+
+    # 分段文件名: {sequence}.{precision}.lp
+    def _segments(self) -> list[Path]:
+        return sorted(self.path.glob("*.lp"))
+
+    def _new_segment(self, precision: str) -> Path:
+        self._sequence += 1
+        return self.path.joinpath(f"{self._sequence:020d}.{precision}.lp")
+
+    @property
+    def size(self) -> int:
+        return sum(segment.stat().st_size for segment in self._segments())
+
+    def append(self, body: bytes, precision: str = "ns"):
+        if not body:
+            return
+
+        body += b"\n"
+        with self._lock:
+            if len(body) > self.max_bytes:
+                self.dropped_bytes += len(body)
+                logger.error(f"InfluxDB spool is full, drop {len(body)} bytes")
+                return
+
+            # 超出总大小时丢弃最早的分段, 正在重放的分段除外
+            size = self.size
+            for segment in self._segments():
+                if size + len(body) <= self.max_bytes:
+                    break
+                if segment == self._replaying:
+                    continue
+
+                segment_size = segment.stat().st_size
+                segment.unlink()
+                size -= segment_size
+                self.dropped_bytes += segment_size
+                if segment == self._current:
+                    self._current = None
+
+            if (
+                self._current is None
+                or not self._current.name.endswith(f".{precision}.lp")
+                or self._current.stat().st_size + len(body) > self.segment_bytes
+            ):
+                self._current = self._new_segment(precision)
+
+            with self._current.open("ab") as f:
+                f.write(body)
+
+            self.healthy = False
+
+        self._wakeup.set()
+
+    def start(self, send: Callable[[bytes, str], None]):
+        """启动重放线程, send(body, precision) 失败时应抛出异常"""
+        self._thread = threading.Thread(
+            target=self._run, args=(send,), name="InfluxDBSpool", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def replay(self, send: Callable[[bytes, str], None]) -> bool:
+        """重放所有暂存的分段, 返回是否全部成功"""
+        with self._lock:
+            # 当前分段不再追加, 之后的数据写入新的分段
+            self._current = None
+            segments = self._segments()
+
+        for segment in segments:
+            precision = segment.name.split(".")[1]
+            with self._lock:
+                # 可能已因超出总大小被丢弃
+                if not segment.exists():
+                    continue
+                self._replaying = segment
+            try:
+                send(segment.read_bytes(), precision)
+            except Exception as e:
+                if _is_retryable(e):
+                    logger.error(f"InfluxDB spool replay error: {e}")
+                    return False
+
+                logger.error(f"InfluxDB spool segment {segment.name} rejected: {e}")
+                segment.rename(segment.with_suffix(".rejected"))
+                continue
+            finally:
+                with self._lock:
+                    self._replaying = None
+
+            segment.unlink()
+
+        with self._lock:
+            if not self._segments():
+                self.healthy = True
+
+        return True
+
+    def _run(self, send: Callable[[bytes, str], None]):
+        failures = 0
+        while not self._closed:
+            if not self._segments():
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            if self.replay(send):
+                failures = 0
+                continue
+
+            backoff = min(self.max_backoff, self.min_backoff * 2**failures)
+            failures += 1
+            self._wakeup.wait(backoff)
+            self._wakeup.clear()
+
+
+def _collector_family(address: str | tuple[str, int]) -> socket.AddressFamily:
+    # 字符串为 UNIX socket 路径, (host, port) 为 UDP 地址
+    return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+
+class InfluxDBCollector:
+    """本机写入汇聚
+
+    同一主机上的多个 worker 进程以 write_mode="collector" 将 line protocol 通过
+    UNIX socket/UDP 数据报发送到此处, 汇聚为大批量(batch_size 行或 flush_interval 秒)
+    后由 connect 写入 InfluxDB. 需要在独立进程中运行, 例如:
+
+        with InfluxDBConnect(..., spool=InfluxDBSpool(...)) as c:
+            InfluxDBCollector(c, "/run/influxdb-collector.sock").serve_forever()
+
+    数据报格式: 第一行为时间精度(s/ms/us/ns), 其后为 line protocol
+
+    写入 InfluxDB 在独立的线程中进行, 不阻塞接收; 待写入的批次超过 max_pending_batches 时
+    暂停接收, worker 以非阻塞方式发送, 接收缓冲区满时改为直接写入 InfluxDB
+
+    worker 只在发送出错时(如 UNIX socket 不存在、接收缓冲区满)改为直接写入 InfluxDB;
+    使用 UDP 时, collector 未运行或接收缓冲区满都不会报错, 数据会被静默丢弃,
+    不能丢失数据的场景应使用 UNIX socket
+    """
+
+    recv_bytes = 65_536
+    max_pending_batches = 16
+
+    def __init__(
+        self,
+        connect: "InfluxDBConnect",
+        address: str | tuple[str, int],
+        batch_size: int = 5000,
+        flush_interval: float = 1.0,
+    ):
+        self._connect = connect
+        self.address = address
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+        self._batches: dict[str, list[bytes]] = dict()
+        self._batch_lines: dict[str, int] = dict()
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+        # 已汇聚完成的 (body, precision), None 表示结束
+        self._pending: queue.Queue[tuple[bytes, str] | None] = queue.Queue(
+            maxsize=self.max_pending_batches
+        )
+        self._write_thread = threading.Thread(
+            target=self._write_pending, name="InfluxDBCollectorWriter", daemon=True
+        )
+        self._write_thread.start()
+
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+        self._sock = socket.socket(_collector_family(address), socket.SOCK_DGRAM)
+        self._sock.bind(address)
+        if not isinstance(address, str):
+            # 端口为 0 时由系统分配
+            self.address = self._sock.getsockname()
+
+    def _append(self, datagram: bytes):
+        precision, _, body = datagram.partition(b"\n")
+        precision = precision.decode("ascii", errors="replace")
+        if precision not in _PRECISION_SCALE or not body:
+            logger.error(f"InfluxDB collector drop invalid datagram: {datagram[:64]!r}")
+            return
+
+        self._batches.setdefault(precision, list()).append(body)
+        lines = self._batch_lines.get(precision, 0) + body.count(b"\n") + 1
+        self._batch_lines[precision] = lines
+        if lines >= self._batch_size:
+            self._flush(precision)
+
+    def _flush(self, precision: str):
+        batch = self._batches.pop(precision, None)
+        self._batch_lines.pop(precision, None)
+        if not batch:
+            return
+
+        self._pending.put((b"\n".join(batch), precision))
+
+    def _flush_all(self):
+        for precision in list(self._batches):
+            self._flush(precision)
+
+    def _write_pending(self):
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    return
+
+                body, precision = item
+                try:
+                    self._connect._write(body, precision)
+                except Exception as e:
+                    logger.error(f"InfluxDB collector write error: {e}")
+            finally:
+                self._pending.task_done()
+
+    def flush(self):
+        """写入所有已接收的数据, 等待写入完成"""
+        self._flush_all()
+        self._pending.join()
+
+    def serve_forever(self):
+        deadline = time.monotonic() + self._flush_interval
+        while not self._closed:
+            # 定期醒来以检查 close()
+            timeout = min(0.5, deadline - time.monotonic())
+            if timeout > 0:
+                self._sock.settimeout(timeout)
+                try:
+                    self._append(self._sock.recv(self.recv_bytes))
+                    continue
+                except socket.timeout:
+                    pass
+                except OSError:
+                    if self._closed:
+                        break
+                    raise
+
+            if time.monotonic() >= deadline:
+                self._flush_all()
+                deadline = time.monotonic() + self._flush_interval
+
+        # 接收 close() 之前已到达的数据
+        self._sock.setblocking(False)
+        while True:
+            try:
+                self._append(self._sock.recv(self.recv_bytes))
+            except OSError:
+                break
+        self._flush_all()
+
+    def start(self):
+        """在后台线程中运行"""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="InfluxDBCollector", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        self._closed = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._write_thread.is_alive():
+            # 写入剩余的数据后结束写入线程
+            self._flush_all()
+            self._pending.put(None)
+            self._write_thread.join()
+        self._sock.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
 
 class InfluxDBConnect:
+    # collector 模式下单个数据报的最大字节数
+    collector_datagram_bytes = 60_000
+
     def __init__(
         self,
         url: str,
@@ -18,6 +849,15 @@ class InfluxDBConnect:
         token: str,
         timeout: int = 10_000,
         write_batch_size: int = 1,
+        enable_gzip: bool = False,
+        write_mode: Literal["sync", "background", "collector"] = "sync",
+        flush_interval: float = 1.0,
+        background_batch_size: int = 5000,
+        max_queue_size: int = 100_000,
+        backpressure: Literal["block", "drop_oldest", "drop_newest"] = "block",
+        query_cache: InfluxDBQueryCache | None = None,
+        spool: InfluxDBSpool | None = None,
+        collector_address: str | tuple[str, int] | None = None,
     ):
         self._url = url
         self._org = org
@@ -28,41 +868,171 @@ class InfluxDBConnect:
             token=token,
             org=org,
             timeout=timeout,
-            enable_gzip=False,
+            enable_gzip=enable_gzip,
         )
 
         if 1 < write_batch_size <= 1000:
             self._write_batch_size = write_batch_size
         else:
             self._write_batch_size = 1
+        # 多线程共享同一实例时保护批量数据
+        self._write_batch_lock = threading.Lock()
         self._write_batch_data: list[dict] = list()
         self._write_batch_count = 0
 
         self._write_api = self._client.write_api(write_options=SYNCHRONOUS)
 
         self._query_api = self._client.query_api()
+        self._query_cache = query_cache
+
+        # 写入失败的数据进入磁盘暂存, 由后台线程重放
+        self._spool = spool
+        if spool is not None:
+            spool.start(self._send)
+
+        # background 模式下, 由后台线程按数量(background_batch_size)/最大延迟批量写入,
+        # 不受 write_batch_size 的上限影响
+        self._background_writer: InfluxDBBackgroundWriter | None = None
+        if write_mode == "background":
+            self._background_writer = InfluxDBBackgroundWriter(
+                self._write,
+                batch_size=background_batch_size,
+                flush_interval=flush_interval,
+                max_queue_size=max_queue_size,
+                backpressure=backpressure,
+            )
+        elif write_mode not in ("sync", "collector"):
+            raise ValueError(f"Unsupported write_mode: {write_mode}")
+
+        # collector 模式下, 数据发送到本机的 InfluxDBCollector 汇聚后再写入
+        self._collector_address = collector_address
+        self._collector_sock: socket.socket | None = None
+        if write_mode == "collector":
+            if collector_address is None:
+                raise ValueError("collector_address is required in collector mode")
+            self._collector_sock = socket.socket(
+                _collector_family(collector_address), socket.SOCK_DGRAM
+            )
+            # 非阻塞发送, collector 的接收缓冲区满时(BlockingIOError)改为直接写入,
+            # 请求延迟不受 collector 写入 InfluxDB 的耗时影响
+            self._collector_sock.setblocking(False)
+
+    def _send(self, data, precision: str = "ns"):
+        self._write_api.write(
+            bucket=self._bucket, org=self._org, record=data, write_precision=precision
+        )
+
+    def _write(self, data, precision: str = "ns"):
+        if self._spool is None:
+            self._send(data, precision)
+            return
+
+        if self._spool.healthy:
+            try:
+                self._send(data, precision)
+                return
+            except (InfluxDBError, HTTPError, TimeoutError, ConnectTimeoutError) as e:
+                # 被拒绝的数据重放也不会成功, 不进入暂存
+                if not _is_retryable(e):
+                    raise
+                logger.error(f"InfluxDB write error, spool the data: {e}")
+
+        self._spool.append(_to_line_protocol(data), precision)
+
+    def _collector_chunks(self, body: bytes) -> Iterator[bytes]:
+        chunk: list[bytes] = list()
+        size = 0
+        # 按行拆分为多个数据报, 单行超出上限时单独发送
+        for line in body.split(b"\n"):
+            if chunk and size + len(line) + 1 > self.collector_datagram_bytes:
+                yield b"\n".join(chunk)
+                chunk.clear()
+                size = 0
+            chunk.append(line)
+            size += len(line) + 1
+
+        if chunk:
+            yield b"\n".join(chunk)
+
+    def _dispatch(self, data, precision: str = "ns"):
+        if self._collector_sock is None:
+            self._write(data, precision)
+            return
 
-    def _write(self, data):
-        self._write_api.write(bucket=self._bucket, org=self._org, record=data)
+        header = precision.encode("ascii") + b"\n"
+        chunks = list(self._collector_chunks(_to_line_protocol(data)))
+        for i, chunk in enumerate(chunks):
+            try:
+                self._collector_sock.sendto(header + chunk, self._collector_address)
+            except OSError as e:
+                # collector 不可用或接收缓冲区满时直接写入尚未发送的部分, 已发送的不重复写入
+                logger.error(f"InfluxDB collector send error, write directly: {e}")
+                self._write(b"\n".join(chunks[i:]), precision)
+                return
 
-    def _write_batch(self):
-        self._write(self._write_batch_data)
-        self._write_batch_data.clear()
+    def _take_batch(self) -> list[dict]:
+        # 调用方需持有 _write_batch_lock
+        batch = self._write_batch_data
+        self._write_batch_data = list()
         self._write_batch_count = 0
+        return batch
 
     def write(self, data: dict | list[dict]):
+        if self._background_writer is not None:
+            self._background_writer.put(data)
+            return
+
         if self._write_batch_size == 1 or isinstance(data, list):
-            self._write(data)
+            self._dispatch(data)
+            return
+
+        with self._write_batch_lock:
+            self._write_batch_data.append(data)
+            self._write_batch_count += 1
+            if self._write_batch_count < self._write_batch_size:
+                return
+            batch = self._take_batch()
+
+        # 在锁外写入, 不阻塞其它线程继续追加
+        self._dispatch(batch)
+
+    def write_columns(
+        self,
+        measurement: str,
+        tags: dict[str, Sequence],
+        fields: dict[str, Sequence],
+        timestamps: Sequence,
+        precision: Literal["s", "ms", "us", "ns"] = "ns",
+    ):
+        """列式批量写入, 直接构造 line protocol, 跳过客户端库的逐点序列化
+
+        建议配合 enable_gzip=True 使用
+        """
+        body = columns_to_line_protocol(
+            measurement, tags, fields, timestamps, precision=precision
+        )
+        if not body:
             return
 
-        self._write_batch_data.append(data)
-        self._write_batch_count += 1
-        if self._write_batch_count >= self._write_batch_size:
-            self._write_batch()
+        self._dispatch(body, precision)
 
     def flush(self):
-        if self._write_batch_count >= 1:
-            self._write_batch()
+        if self._background_writer is not None:
+            self._background_writer.flush()
+            return
+
+        with self._write_batch_lock:
+            batch = self._take_batch()
+        if batch:
+            self._dispatch(batch)
+
+    @property
+    def write_dropped(self) -> int:
+        """background 模式下因队列满而丢弃的数据数量"""
+        if self._background_writer is None:
+            return 0
+
+        return self._background_writer.dropped
 
     def __enter__(self):
         """
@@ -77,7 +1047,13 @@ class InfluxDBConnect:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Exit the runtime context related to this object and close the connect."""
+        if self._background_writer is not None:
+            self._background_writer.close()
         self.flush()
+        if self._spool is not None:
+            self._spool.close()
+        if self._collector_sock is not None:
+            self._collector_sock.close()
         self._write_api.close()
         self._client.close()
 
@@ -87,12 +1063,114 @@ class InfluxDBConnect:
         )
         return self._query_api.query(q)
 
+    def _query_with_columns(self, q: str, cs: list[str]) -> list:
+        return self._query_api.query(q).to_values(columns=cs)
+
     def query_with_columns(self, q: str, cs: list[str]) -> list:
         try:
-            return self._query_api.query(q).to_values(columns=cs)
+            if self._query_cache is not None:
+                # 出错的结果不会被缓存
+                return self._query_cache.get_or_query(
+                    q, cs, lambda: self._query_with_columns(q, cs)
+                )
+
+            return self._query_with_columns(q, cs)
         except (InfluxDBError, HTTPError, TimeoutError, ConnectTimeoutError) as e:
             logger.error(f"InfluxDB access error: {e}")
             return []
 
+    def query_stream(
+        self, q: str, cs: list[str] | None = None, chunk_size: int | None = None
+    ) -> Iterator[FluxRecord | list | list[list]]:
+        """边解析响应边返回结果, 不在内存中保留完整的结果集
+
+        cs 为 None 时返回 FluxRecord, 否则返回与 query_with_columns 相同格式的行;
+        指定 chunk_size 时, 每次返回最多 chunk_size 条组成的列表;
+        返回任何结果前出错时记录日志并结束迭代(与 query_with_columns 返回 [] 一致),
+        已返回部分结果后出错时记录日志并抛出异常, 避免不完整的结果被当作完整结果使用
+        """
+        try:
+            records = self._query_api.query_stream(q)
+        except (InfluxDBError, HTTPError, TimeoutError, ConnectTimeoutError) as e:
+            logger.error(f"InfluxDB access error: {e}")
+            return
+
+        if cs is None:
+            rows = records
+        else:
+            rows = ([record.values.get(c) for c in cs] for record in records)
+
+        if chunk_size is not None:
+            rows = (list(chunk) for chunk in batched(rows, chunk_size))
+
+        yielded = False
+        try:
+            for row in rows:
+                yield row
+                yielded = True
+        except (InfluxDBError, HTTPError, TimeoutError, ConnectTimeoutError) as e:
+            logger.error(f"InfluxDB access error: {e}")
+            if yielded:
+                raise
+        finally:
+            # 提前结束迭代时关闭 HTTP 响应
+            records.close()
+
+    def query_columns(
+        self,
+        q: str,
+        cs: list[str],
+        output: Literal["numpy", "arrow"] = "numpy",
+        chunk_size: int = 65_536,
+    ):
+        """按列返回查询结果, 每列为一个类型化的数组
+
+        output:
+            numpy: 返回 dict[str, numpy.ndarray]; 时间为 datetime64[ns], 数值为 float64/int64
+            arrow: 返回 pyarrow.Table
+        结果按 chunk_size 行分块转换, 同一时刻只保留一个分块的 Python 对象;
+        查询中途出错时抛出异常(见 query_stream), 不会返回不完整的结果
+        """
+        match output:
+            case "numpy":
+                import numpy as np
+
+                chunks = list()
+                lengths = list()
+                for rows in self.query_stream(q, cs=cs, chunk_size=chunk_size):
+                    chunks.append(
+                        {
+                            c: _column_to_numpy(np, list(values))
+                            for c, values in zip(cs, zip(*rows))
+                        }
+                    )
+                    lengths.append(len(rows))
+                if not chunks:
+                    return {c: np.array([]) for c in cs}
+
+                # 各分块的类型可能不同(如某一分块全为空), 合并时统一
+                return {
+                    c: _concat_numpy(np, [chunk[c] for chunk in chunks], lengths)
+                    for c in cs
+                }
+
+            case "arrow":
+                import pyarrow as pa
+
+                tables = [
+                    pa.table(
+                        {c: pa.array(list(values)) for c, values in zip(cs, zip(*rows))}
+                    )
+                    for rows in self.query_stream(q, cs=cs, chunk_size=chunk_size)
+                ]
+                if not tables:
+                    return pa.table({c: pa.array([], type=pa.null()) for c in cs})
+
+                # permissive: 全空分块的 null 类型与 int64/float64 等数值类型统一为可容纳的类型
+                return pa.concat_tables(tables, promote_options="permissive")
+
+            case _:
+                raise ValueError(f"Unsupported output: {output}")
+
     def query_data_frame(self, q: str):
         return self._query_api.query_data_frame(q)
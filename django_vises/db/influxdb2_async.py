@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Sequence
+from typing import Literal
+
+from aiohttp import ClientError
+from influxdb_client.client.exceptions import InfluxDBError
+from influxdb_client.client.flux_table import FluxRecord
+from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+
+from .influxdb2 import columns_to_line_protocol
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncInfluxDBConnect:
+    """InfluxDBConnect 的 asyncio 版本, 需要在事件循环中创建
+
+    async with AsyncInfluxDBConnect(...) as c:
+        await c.write({...})
+    """
+
+    def __init__(
+        self,
+        url: str,
+        org: str,
+        bucket: str,
+        token: str,
+        timeout: int = 10_000,
+        write_batch_size: int = 1,
+        enable_gzip: bool = False,
+        flush_interval: float | None = None,
+    ):
+        self._url = url
+        self._org = org
+        self._bucket = bucket
+        self._token = token
+        self._client = InfluxDBClientAsync(
+            url=url,
+            token=token,
+            org=org,
+            timeout=timeout,
+            enable_gzip=enable_gzip,
+        )
+
+        if 1 < write_batch_size <= 1000:
+            self._write_batch_size = write_batch_size
+        else:
+            self._write_batch_size = 1
+        self._write_batch_data: list[dict] = list()
+        self._write_batch_lock = asyncio.Lock()
+
+        # 指定 flush_interval 时, 由后台任务定时写入未满的批次
+        self._flush_interval = flush_interval
+        self._flush_task: asyncio.Task | None = None
+
+        self._write_api = self._client.write_api()
+
+        self._query_api = self._client.query_api()
+
+    async def _write(self, data, precision: str = "ns"):
+        await self._write_api.write(
+            bucket=self._bucket, org=self._org, record=data, write_precision=precision
+        )
+
+    async def _write_batch(self):
+        async with self._write_batch_lock:
+            if not self._write_batch_data:
+                return
+
+            data = self._write_batch_data
+            self._write_batch_data = list()
+
+        await self._write(data)
+
+    async def _flush_batch(self):
+        try:
+            await self._write_batch()
+        except (InfluxDBError, ClientError, TimeoutError) as e:
+            logger.error(f"InfluxDB write error: {e}")
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            write = asyncio.ensure_future(self._flush_batch())
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # close() 取消时批次已被取出, 等待其写完, 避免丢失
+                await write
+                raise
+
+    async def write(self, data: dict | list[dict]):
+        if self._write_batch_size == 1 or isinstance(data, list):
+            await self._write(data)
+            return
+
+        if self._flush_interval is not None and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+        async with self._write_batch_lock:
+            self._write_batch_data.append(data)
+            full = len(self._write_batch_data) >= self._write_batch_size
+
+        if full:
+            await self._write_batch()
+
+    async def write_columns(
+        self,
+        measurement: str,
+        tags: dict[str, Sequence],
+        fields: dict[str, Sequence],
+        timestamps: Sequence,
+        precision: Literal["s", "ms", "us", "ns"] = "ns",
+    ):
+        body = columns_to_line_protocol(
+            measurement, tags, fields, timestamps, precision=precision
+        )
+        if not body:
+            return
+
+        await self._write(body, precision)
+
+    async def flush(self):
+        await self._write_batch()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        try:
+            await self.flush()
+        finally:
+            await self._client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def query_with_columns(self, q: str, cs: list[str]) -> list:
+        try:
+            return (await self._query_api.query(q)).to_values(columns=cs)
+        except (InfluxDBError, ClientError, TimeoutError) as e:
+            logger.error(f"InfluxDB access error: {e}")
+            return []
+
+    async def query_stream(
+        self, q: str, cs: list[str] | None = None, chunk_size: int | None = None
+    ) -> AsyncIterator[FluxRecord | list | list[list]]:
+        """与 InfluxDBConnect.query_stream 相同, 已返回部分结果后出错时抛出异常"""
+        try:
+            records = await self._query_api.query_stream(q)
+        except (InfluxDBError, ClientError, TimeoutError) as e:
+            logger.error(f"InfluxDB access error: {e}")
+            return
+
+        yielded = False
+        try:
+            chunk = list()
+            async for record in records:
+                row = record if cs is None else [record.values.get(c) for c in cs]
+                if chunk_size is None:
+                    yield row
+                    yielded = True
+                    continue
+
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    yielded = True
+                    chunk = list()
+
+            if chunk:
+                yield chunk
+        except (InfluxDBError, ClientError, TimeoutError) as e:
+            logger.error(f"InfluxDB access error: {e}")
+            if yielded:
+                raise
+        finally:
+            await records.aclose()
@@ -1,15 +1,241 @@
-from collections.abc import Iterable, MutableSet
-from uuid import UUID
+import hashlib
+import math
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable, Iterable, Iterator, MutableSet
+from itertools import batched, chain, islice
+from threading import Lock
+from typing import Literal, Self
+from uuid import UUID, uuid4
 
 import redis
+import redis.asyncio
 
 # https://redis.io/docs/latest/commands/sadd/
 
 _REDIS_URI = "redis://localhost:6379/0"
 _REDIS_SET_NAME = "set_name"
 
+# intset 编码仅支持 64 位有符号整数
+# https://redis.io/docs/latest/develop/data-types/sets/#performance
+_INT64_MIN = -(2**63)
+_INT64_MAX = 2**63 - 1
+
+# 进程级的连接池注册表, 以 redis_uri 为 key, 在所有集合实例间共享
+_connection_pools: dict[str, redis.ConnectionPool] = dict()
+_connection_pools_lock = Lock()
+
+
+def get_connection_pool(redis_uri: str = _REDIS_URI) -> redis.ConnectionPool:
+    with _connection_pools_lock:
+        pool = _connection_pools.get(redis_uri)
+        if pool is None:
+            # 可以通过 uri 参数调整连接池, 如: redis://host:6379/0?max_connections=50
+            pool = redis.ConnectionPool.from_url(redis_uri)
+            _connection_pools[redis_uri] = pool
+
+        return pool
+
+
+def _get_redis_client(
+    redis_uri: str,
+    redis_client: redis.Redis | None,
+    connection_pool: redis.ConnectionPool | None,
+) -> redis.Redis:
+    # 优先级: redis_client > connection_pool > 按 redis_uri 共享的连接池
+    if redis_client is not None:
+        return redis_client
+
+    if connection_pool is None:
+        connection_pool = get_connection_pool(redis_uri)
+
+    return redis.Redis(connection_pool=connection_pool)
+
+
+def get_connection_pool_stats(pool: redis.ConnectionPool) -> dict[str, int | None]:
+    """连接池的连接数量, 不支持的连接池类型返回 None"""
+    created = in_use = available = None
+    if isinstance(pool, redis.BlockingConnectionPool):
+        # 队列中为空闲连接, 未创建的连接以 None 占位
+        with pool._lock:
+            created = len(pool._connections)
+            available = sum(1 for connection in pool.pool.queue if connection)
+        in_use = created - available
+    elif hasattr(pool, "_in_use_connections"):
+        created = pool._created_connections
+        in_use = len(pool._in_use_connections)
+        available = len(pool._available_connections)
+
+    return {
+        "created": created,
+        "in_use": in_use,
+        "available": available,
+        "max": getattr(pool, "max_connections", None),
+    }
+
+
+def get_connection_pools_stats() -> dict[str, dict[str, int | None]]:
+    with _connection_pools_lock:
+        pools = dict(_connection_pools)
+
+    return {
+        redis_uri: get_connection_pool_stats(pool) for redis_uri, pool in pools.items()
+    }
+
+
+class RedisSetLocalCache:
+    """进程内的集合成员缓存, 用于读多写少的热点集合
+
+    mode:
+        full: 缓存整个集合的成员, 适合小集合
+        lru: 缓存成员检查的结果, 最多 maxsize 条, 适合大集合
+
+    失效方式:
+        - 通过本实例的写操作
+        - keyspace 通知, 需要服务端开启 notify-keyspace-events(至少包含 "K" 与 "s")
+        - ttl 秒后过期兜底
+
+    如果服务端支持 RESP3 client tracking, 也可以直接通过 redis_client 传入
+    redis.Redis(protocol=3, cache_config=CacheConfig()), 由 redis-py 维护缓存
+    """
+
+    def __init__(
+        self,
+        mode: Literal["full", "lru"] = "full",
+        ttl: float = 60,
+        maxsize: int = 10_000,
+        keyspace_notifications: bool = False,
+    ):
+        if mode not in ("full", "lru"):
+            raise ValueError(f"Unsupported mode: {mode}")
+
+        self.mode = mode
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.keyspace_notifications = keyspace_notifications
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = Lock()
+        # 每次失效递增, 避免把失效前发起的查询结果写回缓存
+        self._generation = 0
+        self._members: set[bytes] | None = None
+        self._members_expire_at = 0.0
+        self._answers: OrderedDict[bytes, tuple[bool, float]] = OrderedDict()
+        self._pubsub_thread = None
+
+    def bind(self, conn: redis.Redis, name: str):
+        if not self.keyspace_notifications:
+            return
+
+        db = conn.connection_pool.connection_kwargs.get("db", 0)
+        pubsub = conn.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{f"__keyspace@{db}__:{name}": self._on_keyspace_event})
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def close(self):
+        if self._pubsub_thread is not None:
+            self._pubsub_thread.stop()
+            self._pubsub_thread = None
+
+    def _on_keyspace_event(self, message):
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._members = None
+            self._answers.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": (
+                    len(self._members)
+                    if self._members is not None
+                    else len(self._answers)
+                ),
+            }
+
+    def lookup(
+        self,
+        items: list[str | bytes],
+        fetch: Callable[[list], list[bool]],
+        load: Callable[[], set[bytes]],
+    ) -> list[bool]:
+        # redis-py 以 utf-8 编码发送 str, 统一为 bytes 后与服务端返回的成员比较
+        keys = [
+            item.encode("utf-8") if isinstance(item, str) else item for item in items
+        ]
+        if self.mode == "full":
+            return self._lookup_full(keys, load)
+
+        return self._lookup_lru(keys, fetch)
+
+    def _lookup_full(self, keys: list[bytes], load) -> list[bool]:
+        now = time.monotonic()
+        with self._lock:
+            members = self._members if now < self._members_expire_at else None
+            generation = self._generation
+            if members is None:
+                self.misses += len(keys)
+            else:
+                self.hits += len(keys)
+
+        if members is None:
+            members = load()
+            with self._lock:
+                if generation == self._generation:
+                    self._members = members
+                    self._members_expire_at = now + self.ttl
+
+        return [key in members for key in keys]
+
+    def _lookup_lru(self, keys: list[bytes], fetch) -> list[bool]:
+        now = time.monotonic()
+        result = [False] * len(keys)
+        missing = list()
+        with self._lock:
+            for index, key in enumerate(keys):
+                answer = self._answers.get(key)
+                if answer is not None and now < answer[1]:
+                    self._answers.move_to_end(key)
+                    result[index] = answer[0]
+                else:
+                    missing.append(index)
+
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            generation = self._generation
+
+        if not missing:
+            return result
+
+        founds = fetch([keys[index] for index in missing])
+        with self._lock:
+            for index, found in zip(missing, founds):
+                result[index] = found
+                if generation == self._generation:
+                    self._answers[keys[index]] = (found, now + self.ttl)
+                    self._answers.move_to_end(keys[index])
+
+            while len(self._answers) > self.maxsize:
+                self._answers.popitem(last=False)
+
+        return result
+
 
 class RedisMutableSetAbc(MutableSet):
+    # 批量操作时, 单条 SADD/SREM 命令携带的最大成员数
+    bulk_chunk_size: int = 1000
+    # 迭代时, 每次 SSCAN 的 COUNT 参数
+    scan_count: int = 1000
+    # __repr__ 最多展示的成员数量
+    repr_limit: int = 20
 
     def __init__(
         self,
@@ -17,101 +243,1073 @@ class RedisMutableSetAbc(MutableSet):
         clear: bool = True,
         redis_uri: str = _REDIS_URI,
         redis_set_name: str = _REDIS_SET_NAME,
+        redis_client: redis.Redis | None = None,
+        connection_pool: redis.ConnectionPool | None = None,
+        local_cache: RedisSetLocalCache | None = None,
     ):
-        self._conn = redis.from_url(url=redis_uri)
+        self._conn = _get_redis_client(redis_uri, redis_client, connection_pool)
         self.name = redis_set_name
 
+        self.local_cache = local_cache
+        if local_cache is not None:
+            local_cache.bind(self._conn, self.name)
+
         if clear:
             self.clear()
 
         if iterable:
-            for value in iterable:
-                self.add(value)
+            self.update(iterable)
 
     # redis interface
+    def _changed(self):
+        # 本实例修改了集合, 使本地缓存失效
+        if self.local_cache is not None:
+            self.local_cache.invalidate()
+
     def _add(self, item: str):
         self._conn.sadd(self.name, item)
+        self._changed()
+
+    def _add_many(self, items: Iterable[str]) -> int:
+        # 分块的多参数 SADD, 通过 pipeline 一次往返发送
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            pipe.sadd(self.name, *chunk)
+
+        result = sum(pipe.execute())
+        self._changed()
+        return result
 
     def _discard(self, item: str):
         self._conn.srem(self.name, item)
+        self._changed()
+
+    def _discard_many(self, items: Iterable[str]) -> int:
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            pipe.srem(self.name, *chunk)
+
+        result = sum(pipe.execute())
+        self._changed()
+        return result
 
     def _sismember(self, item: str) -> bool:
+        if self.local_cache is not None:
+            return self._smismember([item])[0]
+
         if self._conn.sismember(self.name, item) == 1:
             return True
 
         return False
 
+    def _smismember(self, items: Iterable[str]) -> list[bool]:
+        if self.local_cache is not None:
+            return self.local_cache.lookup(
+                list(items), self._smismember_remote, self._all
+            )
+
+        return self._smismember_remote(items)
+
+    def _smismember_remote(self, items: Iterable[str | bytes]) -> list[bool]:
+        # 分块的 SMISMEMBER, 通过 pipeline 一次往返发送
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            pipe.smismember(self.name, list(chunk))
+
+        return [found == 1 for result in pipe.execute() for found in result]
+
     def _all(self) -> set[bytes]:
         # 异步模式下，返回的是 collections.abc.Awaitable[set[bytes]]
         return self._conn.smembers(self.name)  # type: ignore
 
+    def _scan(self) -> Iterator[bytes]:
+        # SSCAN 游标迭代, 不阻塞服务端; 迭代期间集合被修改时, 成员可能重复出现
+        return self._conn.sscan_iter(self.name, count=self.scan_count)
+
+    def _server_key(self) -> tuple:
+        kwargs = self._conn.connection_pool.connection_kwargs
+        return (
+            kwargs.get("host"),
+            kwargs.get("port"),
+            kwargs.get("path"),
+            kwargs.get("db", 0),
+        )
+
+    def _is_compatible(self, other) -> bool:
+        # 同类型(编码一致)且位于同一个 Redis 服务/库时, 集合运算可以在服务端完成
+        return (
+            type(other) is type(self)
+            and other._storage_encoding() == self._storage_encoding()
+            and other._server_key() == self._server_key()
+        )
+
+    def _check_compatible(self, others: tuple) -> list[str]:
+        for other in others:
+            if not self._is_compatible(other):
+                raise TypeError(
+                    f"{other!r:.50} is not a {type(self).__name__} on the same server"
+                )
+
+        return [other.name for other in others]
+
+    def _derive(self, name: str) -> Self:
+        # 复用当前连接, 指向另一个 key 的同类型实例
+        obj = self.__class__.__new__(self.__class__)
+        obj.__dict__.update(self.__dict__)
+        obj.name = name
+        obj.local_cache = None
+        return obj
+
+    def _intercard(self, other, limit: int = 0) -> int:
+        return self._conn.sintercard(2, [self.name, other.name], limit=limit)
+
+    def _is_subset(self, other) -> bool:
+        pipe = self._conn.pipeline(transaction=False)
+        pipe.scard(self.name)
+        pipe.sintercard(2, [self.name, other.name])
+        card, intercard = pipe.execute()
+        return card == intercard
+
+    # encode/decode, 由子类实现类型检查与编码
+    def _encode(self, value) -> str | bytes:
+        raise NotImplementedError  # pragma: no cover
+
+    def _decode(self, item: bytes):
+        raise NotImplementedError  # pragma: no cover
+
+    def _storage_encoding(self) -> str | None:
+        # 成员在 Redis 中的存储格式, 格式相同的集合才能在服务端运算
+        return None
+
     # set methods
     def __len__(self):  # type: ignore
         # 异步模式下，返回的是 Awaitable[int]
         return self._conn.scard(self.name)
 
+    def __contains__(self, value):
+        try:
+            item = self._encode(value)
+        except (TypeError, ValueError):
+            return False
+
+        return self._sismember(item)
+
+    def __iter__(self) -> Iterator:
+        return (self._decode(item) for item in self._scan())
+
+    def __repr__(self):
+        items = [
+            str(self._decode(item))
+            for item in islice(self._scan(), self.repr_limit + 1)
+        ]
+        if len(items) > self.repr_limit:
+            items[self.repr_limit :] = ["..."]
+
+        return ", ".join(items)
+
+    def snapshot(self) -> set:
+        """使用 SMEMBERS 一次性加载全部成员, 大集合慎用"""
+        return {self._decode(item) for item in self._all()}
+
+    def pool_stats(self) -> dict[str, int | None]:
+        return get_connection_pool_stats(self._conn.connection_pool)
+
     def add(self, value):
+        self._add(self._encode(value))
+
+    def discard(self, value):
+        self._discard(self._encode(value))
+
+    def clear(self):
+        self._conn.delete(self.name)
+        self._changed()
+
+    # bulk methods
+    def add_many(self, values: Iterable) -> int:
+        """批量添加, 返回新加入的成员数量"""
+        return self._add_many(self._encode(value) for value in values)
+
+    def discard_many(self, values: Iterable) -> int:
+        """批量移除, 返回实际移除的成员数量"""
+        return self._discard_many(self._encode(value) for value in values)
+
+    def contains_many(self, values: Iterable) -> list[bool]:
+        """批量检查成员资格, 结果与 values 一一对应"""
+        values = list(values)
+        result = [False] * len(values)
+
+        indexes, items = list(), list()
+        for index, value in enumerate(values):
+            try:
+                items.append(self._encode(value))
+            except (TypeError, ValueError):
+                continue
+            indexes.append(index)
+
+        for index, found in zip(indexes, self._smismember(items)):
+            result[index] = found
+
+        return result
+
+    def filter_members(self, values: Iterable) -> list:
+        """返回 values 中属于本集合的成员, 保持原有顺序"""
+        values = list(values)
+        return [
+            value for value, found in zip(values, self.contains_many(values)) if found
+        ]
+
+    def update(self, *iterables: Iterable):
+        for iterable in iterables:
+            self.__ior__(iterable)
+
+    def difference_update(self, *iterables: Iterable):
+        for iterable in iterables:
+            self.__isub__(iterable)
+
+    def __ior__(self, it):  # type: ignore
+        if it is self:
+            pass
+        elif self._is_compatible(it):
+            self._conn.sunionstore(self.name, [self.name, it.name])
+            self._changed()
+        else:
+            self.add_many(it)
+
+        return self
+
+    def __isub__(self, it):  # type: ignore
+        if it is self:
+            self.clear()
+        elif self._is_compatible(it):
+            self._conn.sdiffstore(self.name, [self.name, it.name])
+            self._changed()
+        else:
+            self.discard_many(it)
+
+        return self
+
+    # set algebra, 两个操作数均为同一服务上的同类型集合时在服务端计算
+    @classmethod
+    def _from_iterable(cls, it) -> set:
+        # 运算结果以 Python set 返回, 不再隐式创建新的 Redis key
+        return set(it)
+
+    def __and__(self, other):
+        if self._is_compatible(other):
+            return {
+                self._decode(item) for item in self._conn.sinter(self.name, other.name)
+            }
+
+        return super().__and__(other)
+
+    def __or__(self, other):
+        if self._is_compatible(other):
+            return {
+                self._decode(item) for item in self._conn.sunion(self.name, other.name)
+            }
+
+        return super().__or__(other)
+
+    def __sub__(self, other):
+        if self._is_compatible(other):
+            return {
+                self._decode(item) for item in self._conn.sdiff(self.name, other.name)
+            }
+
+        return super().__sub__(other)
+
+    def __xor__(self, other):
+        if self._is_compatible(other):
+            pipe = self._conn.pipeline(transaction=False)
+            pipe.sdiff(self.name, other.name)
+            pipe.sdiff(other.name, self.name)
+            left, right = pipe.execute()
+            return {self._decode(item) for item in left | right}
+
+        return super().__xor__(other)
+
+    def __iand__(self, it):  # type: ignore
+        if self._is_compatible(it):
+            self._conn.sinterstore(self.name, [self.name, it.name])
+            self._changed()
+            return self
+
+        return super().__iand__(it)
+
+    def __ixor__(self, it):  # type: ignore
+        if it is self:
+            self.clear()
+        elif self._is_compatible(it):
+            tmp_name = f"{self.name}:xor:{uuid4().hex}"
+            pipe = self._conn.pipeline(transaction=True)
+            pipe.sdiffstore(tmp_name, [it.name, self.name])
+            pipe.sdiffstore(self.name, [self.name, it.name])
+            pipe.sunionstore(self.name, [self.name, tmp_name])
+            pipe.delete(tmp_name)
+            pipe.execute()
+            self._changed()
+        else:
+            super().__ixor__(it)
+
+        return self
+
+    def isdisjoint(self, other) -> bool:
+        if self._is_compatible(other):
+            return self._intercard(other, limit=1) == 0
+
+        return super().isdisjoint(other)
+
+    def __le__(self, other):
+        if self._is_compatible(other):
+            return self._is_subset(other)
+
+        return super().__le__(other)
+
+    def __lt__(self, other):
+        if self._is_compatible(other):
+            return len(self) < len(other) and self._is_subset(other)
+
+        return super().__lt__(other)
+
+    def __ge__(self, other):
+        if self._is_compatible(other):
+            return other._is_subset(self)
+
+        return super().__ge__(other)
+
+    def __gt__(self, other):
+        if self._is_compatible(other):
+            return len(self) > len(other) and other._is_subset(self)
+
+        return super().__gt__(other)
+
+    def __eq__(self, other):
+        if self._is_compatible(other):
+            return len(self) == len(other) and self._is_subset(other)
+
+        return super().__eq__(other)
+
+    __hash__ = None  # type: ignore
+
+    # materialized results, 结果保存到新的 key 中
+    def intersection_store(self, dest: str, *others) -> Self:
+        self._conn.sinterstore(dest, [self.name, *self._check_compatible(others)])
+        if dest == self.name:
+            self._changed()
+        return self._derive(dest)
+
+    def union_store(self, dest: str, *others) -> Self:
+        self._conn.sunionstore(dest, [self.name, *self._check_compatible(others)])
+        if dest == self.name:
+            self._changed()
+        return self._derive(dest)
+
+    def difference_store(self, dest: str, *others) -> Self:
+        self._conn.sdiffstore(dest, [self.name, *self._check_compatible(others)])
+        if dest == self.name:
+            self._changed()
+        return self._derive(dest)
+
+    def intersection_len(self, *others) -> int:
+        """交集的成员数量(SINTERCARD), 不传输成员"""
+        names = [self.name, *self._check_compatible(others)]
+        return self._conn.sintercard(len(names), names)
+
+
+class AsyncRedisSetAbc:
+    """基于 redis.asyncio 的集合, 接口与 RedisMutableSetAbc 对应, 方法均为 async"""
+
+    bulk_chunk_size: int = 1000
+    scan_count: int = 1000
+
+    def __init__(
+        self,
+        redis_uri: str = _REDIS_URI,
+        redis_set_name: str = _REDIS_SET_NAME,
+        redis_client: redis.asyncio.Redis | None = None,
+        connection_pool: redis.asyncio.ConnectionPool | None = None,
+    ):
+        # asyncio 连接池与事件循环绑定, 不放入进程级的连接池注册表
+        if redis_client is not None:
+            self._conn = redis_client
+            self._own_conn = False
+        elif connection_pool is not None:
+            self._conn = redis.asyncio.Redis(connection_pool=connection_pool)
+            self._own_conn = False
+        else:
+            self._conn = redis.asyncio.from_url(url=redis_uri)
+            self._own_conn = True
+        self.name = redis_set_name
+
+    @classmethod
+    async def create(cls, iterable=(), clear: bool = True, **kwargs) -> Self:
+        """对应同步版本的构造函数, 可选的清空与初始化数据需要 await"""
+        obj = cls(**kwargs)
+        if clear:
+            await obj.clear()
+
+        if iterable:
+            await obj.update(iterable)
+
+        return obj
+
+    async def aclose(self):
+        if self._own_conn:
+            await self._conn.aclose()
+
+    # encode/decode, 由子类实现类型检查与编码
+    def _encode(self, value) -> str | bytes:
+        raise NotImplementedError  # pragma: no cover
+
+    def _decode(self, item: bytes):
         raise NotImplementedError  # pragma: no cover
 
+    # set methods
+    async def len(self) -> int:
+        return await self._conn.scard(self.name)
+
+    async def contains(self, value) -> bool:
+        try:
+            item = self._encode(value)
+        except (TypeError, ValueError):
+            return False
+
+        return await self._conn.sismember(self.name, item) == 1
+
+    async def __aiter__(self):
+        async for item in self._conn.sscan_iter(self.name, count=self.scan_count):
+            yield self._decode(item)
+
+    async def snapshot(self) -> set:
+        return {self._decode(item) for item in await self._conn.smembers(self.name)}
+
+    async def add(self, value):
+        await self._conn.sadd(self.name, self._encode(value))
+
+    async def discard(self, value):
+        await self._conn.srem(self.name, self._encode(value))
+
+    async def clear(self):
+        await self._conn.delete(self.name)
+
+    # bulk methods
+    async def add_many(self, values: Iterable) -> int:
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(
+            (self._encode(value) for value in values), self.bulk_chunk_size
+        ):
+            pipe.sadd(self.name, *chunk)
+
+        return sum(await pipe.execute())
+
+    async def discard_many(self, values: Iterable) -> int:
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(
+            (self._encode(value) for value in values), self.bulk_chunk_size
+        ):
+            pipe.srem(self.name, *chunk)
+
+        return sum(await pipe.execute())
+
+    async def update(self, *iterables: Iterable):
+        for iterable in iterables:
+            await self.add_many(iterable)
+
+    async def difference_update(self, *iterables: Iterable):
+        for iterable in iterables:
+            await self.discard_many(iterable)
+
+    async def contains_many(self, values: Iterable) -> list[bool]:
+        values = list(values)
+        result = [False] * len(values)
+
+        indexes, items = list(), list()
+        for index, value in enumerate(values):
+            try:
+                items.append(self._encode(value))
+            except (TypeError, ValueError):
+                continue
+            indexes.append(index)
+
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            pipe.smismember(self.name, list(chunk))
+        founds = [found == 1 for chunk in await pipe.execute() for found in chunk]
+
+        for index, found in zip(indexes, founds):
+            result[index] = found
+
+        return result
+
+    async def filter_members(self, values: Iterable) -> list:
+        values = list(values)
+        return [
+            value
+            for value, found in zip(values, await self.contains_many(values))
+            if found
+        ]
+
+
+# 在服务端原子地查找并移除一批已过期的成员, 避免移除期间被重新写入(续期)的成员
+_EXPIRING_SET_TRIM_SCRIPT = """
+local expired = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2])
+if #expired == 0 then
+    return 0
+end
+return redis.call("ZREM", KEYS[1], unpack(expired))
+"""
+
+
+class RedisExpiringSetAbc(RedisMutableSetAbc):
+    """成员带过期时间的集合, 以 sorted set 存储, score 为成员的过期时间戳
+
+    已过期的成员对成员检查/迭代/长度不可见, 并在写入时按批次惰性清理.
+    过期时间使用客户端时钟, 多个客户端之间需要保持时钟同步
+    """
+
+    # 每次惰性清理最多移除的成员数量
+    trim_batch_size: int = 1000
+    # 两次惰性清理之间的最小间隔(秒)
+    trim_interval: float = 1.0
+
+    def __init__(self, iterable=(), ttl: float = 600, **kwargs):
+        self.ttl = ttl
+        self._trimmed_at = 0.0
+        self._trim_script = None
+
+        super().__init__(iterable, **kwargs)
+
+    # redis interface
+    def _add(self, item: str, ttl: float | None = None):
+        expire_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._conn.zadd(self.name, {item: expire_at})
+        self._changed()
+        self._trim()
+
+    def _add_many(self, items: Iterable[str], ttl: float | None = None) -> int:
+        expire_at = time.time() + (self.ttl if ttl is None else ttl)
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            pipe.zadd(self.name, dict.fromkeys(chunk, expire_at))
+
+        result = sum(pipe.execute())
+        self._changed()
+        self._trim()
+        return result
+
+    def _discard(self, item: str):
+        self._conn.zrem(self.name, item)
+        self._changed()
+
+    def _discard_many(self, items: Iterable[str]) -> int:
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            pipe.zrem(self.name, *chunk)
+
+        result = sum(pipe.execute())
+        self._changed()
+        return result
+
+    def _sismember(self, item: str) -> bool:
+        if self.local_cache is not None:
+            return self._smismember([item])[0]
+
+        score = self._conn.zscore(self.name, item)
+        return score is not None and score > time.time()
+
+    def _smismember_remote(self, items: Iterable[str | bytes]) -> list[bool]:
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            pipe.zmscore(self.name, list(chunk))
+
+        now = time.time()
+        return [
+            score is not None and score > now
+            for result in pipe.execute()
+            for score in result
+        ]
+
+    def _all(self) -> set[bytes]:
+        return set(self._conn.zrangebyscore(self.name, f"({time.time()}", "+inf"))
+
+    def _scan(self) -> Iterator[bytes]:
+        now = time.time()
+        for item, score in self._conn.zscan_iter(self.name, count=self.scan_count):
+            if score > now:
+                yield item
+
+    def _is_compatible(self, other) -> bool:
+        # sorted set 不支持 SINTER 等集合命令, 集合运算均在 Python 端完成
+        return False
+
+    def _trim(self):
+        now = time.time()
+        if now - self._trimmed_at < self.trim_interval:
+            return
+
+        self.trim(now)
+
+    def trim(self, now: float | None = None) -> int:
+        """移除一批已过期的成员, 返回移除的数量"""
+        if now is None:
+            now = time.time()
+        self._trimmed_at = now
+
+        if self._trim_script is None:
+            self._trim_script = self._conn.register_script(_EXPIRING_SET_TRIM_SCRIPT)
+
+        return self._trim_script(keys=[self.name], args=[now, self.trim_batch_size])
+
+    # set methods
+    def __len__(self):  # type: ignore
+        return self._conn.zcount(self.name, f"({time.time()}", "+inf")
+
+    def add(self, value, ttl: float | None = None):
+        self._add(self._encode(value), ttl=ttl)
+
+    def add_many(self, values: Iterable, ttl: float | None = None) -> int:
+        return self._add_many((self._encode(value) for value in values), ttl=ttl)
+
+
+class RedisShardedSetAbc(RedisMutableSetAbc):
+    """将成员按哈希分散到 shards 个子 key 的集合, 避免单个超大的热点 key
+
+    子 key 为 "name:0", "name:1"...; hash_tag=True 时为 "{name}:0", "{name}:1"...,
+    在 Redis Cluster 中所有子 key 落在同一个 slot, 可以在事务/脚本中一起操作,
+    但不再分散到不同节点
+    """
+
+    def __init__(self, iterable=(), shards: int = 16, hash_tag: bool = False, **kwargs):
+        if shards < 1:
+            raise ValueError(f"Invalid shards: {shards}")
+
+        self.shards = shards
+        self.hash_tag = hash_tag
+
+        super().__init__(iterable, **kwargs)
+
+    def _shard_names(self) -> list[str]:
+        prefix = f"{{{self.name}}}" if self.hash_tag else self.name
+        return [f"{prefix}:{index}" for index in range(self.shards)]
+
+    def _shard_index(self, item: str | bytes) -> int:
+        # 使用稳定的 crc32, 而不是每个进程随机化的 hash()
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+
+        return zlib.crc32(item) % self.shards
+
+    def _group_by_shard(self, items: Iterable[str | bytes]) -> dict[int, list]:
+        groups = defaultdict(list)
+        for item in items:
+            groups[self._shard_index(item)].append(item)
+
+        return groups
+
+    # redis interface
+    def _add(self, item: str):
+        self._conn.sadd(self._shard_names()[self._shard_index(item)], item)
+        self._changed()
+
+    def _add_many(self, items: Iterable[str]) -> int:
+        names = self._shard_names()
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            for index, group in self._group_by_shard(chunk).items():
+                pipe.sadd(names[index], *group)
+
+        result = sum(pipe.execute())
+        self._changed()
+        return result
+
+    def _discard(self, item: str):
+        self._conn.srem(self._shard_names()[self._shard_index(item)], item)
+        self._changed()
+
+    def _discard_many(self, items: Iterable[str]) -> int:
+        names = self._shard_names()
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            for index, group in self._group_by_shard(chunk).items():
+                pipe.srem(names[index], *group)
+
+        result = sum(pipe.execute())
+        self._changed()
+        return result
+
+    def _sismember(self, item: str) -> bool:
+        return self._smismember([item])[0]
+
+    def _smismember_remote(self, items: Iterable[str | bytes]) -> list[bool]:
+        names = self._shard_names()
+        items = list(items)
+        positions = defaultdict(list)
+        for position, item in enumerate(items):
+            positions[self._shard_index(item)].append(position)
+
+        pipe = self._conn.pipeline(transaction=False)
+        requests = list()
+        for index, shard_positions in positions.items():
+            for chunk in batched(shard_positions, self.bulk_chunk_size):
+                pipe.smismember(names[index], [items[position] for position in chunk])
+                requests.append(chunk)
+
+        result = [False] * len(items)
+        for chunk, founds in zip(requests, pipe.execute()):
+            for position, found in zip(chunk, founds):
+                result[position] = found == 1
+
+        return result
+
+    def _all(self) -> set[bytes]:
+        pipe = self._conn.pipeline(transaction=False)
+        for name in self._shard_names():
+            pipe.smembers(name)
+
+        return set().union(*pipe.execute())
+
+    def _scan(self) -> Iterator[bytes]:
+        return chain.from_iterable(
+            self._conn.sscan_iter(name, count=self.scan_count)
+            for name in self._shard_names()
+        )
+
+    def _is_compatible(self, other) -> bool:
+        # 成员分散在多个 key 中, 集合运算均在 Python 端完成
+        return False
+
+    # set methods
+    def __len__(self):  # type: ignore
+        pipe = self._conn.pipeline(transaction=False)
+        for name in self._shard_names():
+            pipe.scard(name)
+
+        return sum(pipe.execute())
+
+    def clear(self):
+        # UNLINK 在后台线程中释放内存, 不阻塞服务端
+        self._conn.unlink(*self._shard_names())
+        self._changed()
+
+
+class RedisBloomFilterAbc:
+    """基于 Redis bitmap 的 Bloom filter, 回答 "可能存在" / "一定不存在"
+
+    按 capacity 与 error_rate 计算 bitmap 大小与哈希函数个数;
+    同一个 key 的所有使用方需要使用相同的 capacity 与 error_rate
+    """
+
+    bulk_chunk_size: int = 1000
+
+    def __init__(
+        self,
+        iterable=(),
+        clear: bool = True,
+        redis_uri: str = _REDIS_URI,
+        redis_set_name: str = _REDIS_SET_NAME,
+        redis_client: redis.Redis | None = None,
+        connection_pool: redis.ConnectionPool | None = None,
+        capacity: int = 1_000_000,
+        error_rate: float = 0.01,
+    ):
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity: {capacity}")
+        if not 0 < error_rate < 1:
+            raise ValueError(f"Invalid error_rate: {error_rate}")
+
+        # https://en.wikipedia.org/wiki/Bloom_filter#Optimal_number_of_hash_functions
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bit_size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.bit_size / capacity * math.log(2)))
+        if self.bit_size > 2**32:
+            raise ValueError("Bloom filter is larger than the 512MB Redis string limit")
+
+        self._conn = _get_redis_client(redis_uri, redis_client, connection_pool)
+        self.name = redis_set_name
+
+        if clear:
+            self.clear()
+
+        if iterable:
+            self.add_many(iterable)
+
+    def _encode(self, value) -> str | bytes:
+        raise NotImplementedError  # pragma: no cover
+
+    def _offsets(self, item: str | bytes) -> list[int]:
+        # double hashing: h1 + i * h2
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8])
+        h2 = int.from_bytes(digest[8:]) | 1
+        return [(h1 + i * h2) % self.bit_size for i in range(self.hash_count)]
+
+    def _bitfield(self, op: str, items: Iterable[str | bytes]) -> list[bool]:
+        # 每个分块一条 BITFIELD 命令, 每个成员占 hash_count 个子操作
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(items, self.bulk_chunk_size):
+            args = list()
+            for item in chunk:
+                for offset in self._offsets(item):
+                    if op == "SET":
+                        args.extend(("SET", "u1", offset, 1))
+                    else:
+                        args.extend(("GET", "u1", offset))
+            pipe.execute_command("BITFIELD", self.name, *args)
+
+        # SET 返回原有的位, GET 返回当前的位; 全部为 1 即 "可能存在"
+        return [
+            all(bits[i : i + self.hash_count])
+            for bits in pipe.execute()
+            for i in range(0, len(bits), self.hash_count)
+        ]
+
+    def add(self, value) -> bool:
+        """添加成员, 返回该成员此前是否一定不存在"""
+        return self.add_many([value]) == 1
+
+    def add_many(self, values: Iterable) -> int:
+        """批量添加, 返回此前一定不存在的成员数量"""
+        items = (self._encode(value) for value in values)
+        return sum(not existed for existed in self._bitfield("SET", items))
+
+    def __contains__(self, value) -> bool:
+        return self.contains_many([value])[0]
+
+    def contains_many(self, values: Iterable) -> list[bool]:
+        values = list(values)
+        result = [False] * len(values)
+
+        indexes, items = list(), list()
+        for index, value in enumerate(values):
+            try:
+                items.append(self._encode(value))
+            except (TypeError, ValueError):
+                continue
+            indexes.append(index)
+
+        for index, found in zip(indexes, self._bitfield("GET", items)):
+            result[index] = found
+
+        return result
+
+    def clear(self):
+        self._conn.delete(self.name)
+
+
+class RedisHyperLogLogAbc:
+    """基于 HyperLogLog 的去重计数器, 标准误差约 0.81%"""
+
+    bulk_chunk_size: int = 1000
+
+    def __init__(
+        self,
+        iterable=(),
+        clear: bool = True,
+        redis_uri: str = _REDIS_URI,
+        redis_set_name: str = _REDIS_SET_NAME,
+        redis_client: redis.Redis | None = None,
+        connection_pool: redis.ConnectionPool | None = None,
+    ):
+        self._conn = _get_redis_client(redis_uri, redis_client, connection_pool)
+        self.name = redis_set_name
+
+        if clear:
+            self.clear()
+
+        if iterable:
+            self.add_many(iterable)
+
+    def _encode(self, value) -> str | bytes:
+        raise NotImplementedError  # pragma: no cover
+
+    def add(self, value) -> bool:
+        """添加成员, 返回估算值是否发生变化"""
+        return self._conn.pfadd(self.name, self._encode(value)) == 1
+
+    def add_many(self, values: Iterable) -> bool:
+        pipe = self._conn.pipeline(transaction=False)
+        for chunk in batched(
+            (self._encode(value) for value in values), self.bulk_chunk_size
+        ):
+            pipe.pfadd(self.name, *chunk)
+
+        return any(pipe.execute())
+
+    def __len__(self) -> int:
+        return self._conn.pfcount(self.name)
+
+    def count_union(self, *others: Self) -> int:
+        """多个计数器并集的去重数量, 不修改任何 key"""
+        return self._conn.pfcount(self.name, *[other.name for other in others])
+
+    def merge(self, *others: Self):
+        """将其他计数器合并到本计数器"""
+        self._conn.pfmerge(self.name, self.name, *[other.name for other in others])
+
     def clear(self):
         self._conn.delete(self.name)
 
 
-class RedisSetStr(RedisMutableSetAbc):
-    def add(self, value: str):
+# encode/decode, 同步与异步集合共用
+class _RedisSetStrCodec:
+    def _encode(self, value: str) -> str:
         if not isinstance(value, str):
             raise TypeError
 
-        super()._add(value)
+        return value
 
-    def discard(self, value: str):
-        super()._discard(value)
+    def _decode(self, item: bytes) -> str:
+        return item.decode("utf-8")
 
-    def __contains__(self, item):
-        return self._sismember(item)
 
-    def __iter__(self) -> Iterable[str]:  # type: ignore
-        return iter(item.decode("utf-8") for item in self._all())
-
-    def __repr__(self):
-        return ", ".join([item.decode("utf-8") for item in self._all()])
+class _RedisSetIntCodec:
+    # decimal: 十进制字符串
+    # intset: 同样以十进制字符串存储, 但限制在 int64 范围内,
+    #   避免个别超范围的成员让整个集合从 intset 转换为 hashtable 编码
+    def __init__(
+        self, *args, encoding: Literal["decimal", "intset"] = "decimal", **kwargs
+    ):
+        if encoding not in ("decimal", "intset"):
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.encoding = encoding
 
+        super().__init__(*args, **kwargs)
 
-class RedisSetInt(RedisMutableSetAbc):
-    def add(self, value: int):
-        if not isinstance(value, int):
+    def _encode(self, value: int) -> str:
+        if not isinstance(value, int) or isinstance(value, bool):
             raise TypeError
 
-        super()._add(str(value))
+        if self.encoding == "intset" and not _INT64_MIN <= value <= _INT64_MAX:
+            raise ValueError(f"{value} is out of the intset range")
 
-    def discard(self, value: int):
-        super()._discard(str(value))
+        return str(value)
 
-    def __contains__(self, item):
-        return self._sismember(str(item))
+    def _decode(self, item: bytes) -> int:
+        return int(item)
 
-    def __iter__(self) -> Iterable[int]:  # type: ignore
-        return iter(int(item) for item in super()._all())
+    def _storage_encoding(self) -> str:
+        return "decimal"
 
-    def __repr__(self):
-        return ", ".join([item.decode("utf-8") for item in self._all()])
 
+class _RedisSetUUIDCodec:
+    # hex: 32 字节的十六进制字符串
+    # bytes: 16 字节的原始二进制, 成员体积减半
+    def __init__(self, *args, encoding: Literal["hex", "bytes"] = "hex", **kwargs):
+        if encoding not in ("hex", "bytes"):
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.encoding = encoding
 
-class RedisSetUUID(RedisMutableSetAbc):
-    def add(self, value: UUID):
+        super().__init__(*args, **kwargs)
+
+    def _encode(self, value: UUID) -> str | bytes:
         if not isinstance(value, UUID):
             raise TypeError
 
-        super()._add(value.hex)
+        if self.encoding == "bytes":
+            return value.bytes
 
-    def discard(self, value: UUID):
-        super()._discard(value.hex)
+        return value.hex
 
-    def __contains__(self, value):
-        return self._sismember(value.hex)
+    def _decode(self, item: bytes) -> UUID:
+        if len(item) == 16:
+            return UUID(bytes=item)
 
-    def __iter__(self) -> Iterable[UUID]:  # type: ignore
-        return iter(UUID(item.decode("utf-8")) for item in super()._all())
+        return UUID(item.decode("utf-8"))
 
-    def __repr__(self):
-        return ", ".join([str(UUID(item.decode("utf-8"))) for item in self._all()])
+    def _storage_encoding(self) -> str:
+        return self.encoding
+
+
+class RedisSetStr(_RedisSetStrCodec, RedisMutableSetAbc):
+    pass
+
+
+class RedisSetInt(_RedisSetIntCodec, RedisMutableSetAbc):
+    pass
+
+
+class RedisSetUUID(_RedisSetUUIDCodec, RedisMutableSetAbc):
+    def migrate_encoding(self) -> int:
+        """将集合中其他编码格式的成员原地转换为当前编码, 返回转换的成员数量
+
+        按 SSCAN 分批进行, 不阻塞服务端; 转换期间可以正常读写
+        """
+        source_length = 32 if self.encoding == "bytes" else 16
+
+        count = 0
+        for chunk in batched(self._scan(), self.bulk_chunk_size):
+            items = [item for item in chunk if len(item) == source_length]
+            if not items:
+                continue
+
+            pipe = self._conn.pipeline(transaction=True)
+            pipe.sadd(self.name, *[self._encode(self._decode(item)) for item in items])
+            pipe.srem(self.name, *items)
+            pipe.execute()
+            self._changed()
+            count += len(items)
+
+        return count
+
+
+class AsyncRedisSetStr(_RedisSetStrCodec, AsyncRedisSetAbc):
+    pass
+
+
+class AsyncRedisSetInt(_RedisSetIntCodec, AsyncRedisSetAbc):
+    pass
+
+
+class AsyncRedisSetUUID(_RedisSetUUIDCodec, AsyncRedisSetAbc):
+    pass
+
+
+class RedisExpiringSetStr(_RedisSetStrCodec, RedisExpiringSetAbc):
+    pass
+
+
+class RedisExpiringSetInt(_RedisSetIntCodec, RedisExpiringSetAbc):
+    pass
+
+
+class RedisExpiringSetUUID(_RedisSetUUIDCodec, RedisExpiringSetAbc):
+    pass
+
+
+class RedisShardedSetStr(_RedisSetStrCodec, RedisShardedSetAbc):
+    pass
+
+
+class RedisShardedSetInt(_RedisSetIntCodec, RedisShardedSetAbc):
+    pass
+
+
+class RedisShardedSetUUID(_RedisSetUUIDCodec, RedisShardedSetAbc):
+    pass
+
+
+class RedisBloomFilterStr(_RedisSetStrCodec, RedisBloomFilterAbc):
+    pass
+
+
+class RedisBloomFilterInt(_RedisSetIntCodec, RedisBloomFilterAbc):
+    pass
+
+
+class RedisBloomFilterUUID(_RedisSetUUIDCodec, RedisBloomFilterAbc):
+    pass
+
+
+class RedisHyperLogLogStr(_RedisSetStrCodec, RedisHyperLogLogAbc):
+    pass
+
+
+class RedisHyperLogLogInt(_RedisSetIntCodec, RedisHyperLogLogAbc):
+    pass
+
+
+class RedisHyperLogLogUUID(_RedisSetUUIDCodec, RedisHyperLogLogAbc):
+    pass
@@ -1,14 +1,327 @@
+import asyncio
+import atexit
+import bisect
+import fnmatch
+import functools
+import json
 import os
+import queue
+import random
+import re
+import threading
+import time
 import urllib.parse
-from logging import getLogger
+from logging import INFO, Handler, LogRecord, getLogger
+from logging.handlers import QueueListener
+from pathlib import Path
+from typing import Literal
 
 import logfire
 
+# 数字、UUID、长十六进制等 ID 类路径段
+_ROUTE_ID_SEGMENT = re.compile(
+    r"\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+    r"|[0-9a-fA-F]{16,}"
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _collapse_path(path: str) -> str:
+    """将路径中的 ID 类路径段替换为 {id}, 控制路由数量"""
+    return "/".join(
+        "{id}" if _ROUTE_ID_SEGMENT.fullmatch(segment) else segment
+        for segment in path.split("/")
+    )
+
+
+_LABEL_VALUE_ESCAPE = str.maketrans({"\\": r"\\", '"': r"\"", "\n": r"\n"})
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(
+        f'{name}="{str(value).translate(_LABEL_VALUE_ESCAPE)}"'
+        for name, value in labels.items()
+    )
+
+
+def render_prometheus_metrics(metrics: dict, buckets: tuple[float, ...]) -> str:
+    """将 ASGIMiddlewareAccessLogging.metrics_snapshot() 的结果输出为 Prometheus 文本格式"""
+    lines = [
+        "# HELP http_requests_total Total number of HTTP requests.",
+        "# TYPE http_requests_total counter",
+    ]
+    for method, route, status, count in metrics["requests"]:
+        labels = _labels(method=method, route=route, status=status)
+        lines.append(f"http_requests_total{{{labels}}} {count}")
+
+    lines.extend(
+        [
+            "# HELP http_request_duration_seconds HTTP request latency in seconds.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+    )
+    for key, histogram in metrics["latency"].items():
+        method, _, route = key.partition(" ")
+        labels = _labels(method=method, route=route)
+        cumulative = 0
+        for le, count in zip((*buckets, "+Inf"), histogram["counts"]):
+            cumulative += count
+            lines.append(
+                f'http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}'
+            )
+        lines.append(
+            f"http_request_duration_seconds_sum{{{labels}}} {histogram['sum']}"
+        )
+        lines.append(f"http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+    for name, field, help_text in (
+        ("http_request_body_bytes_total", "request_bytes", "HTTP request body bytes."),
+        (
+            "http_response_body_bytes_total",
+            "response_bytes",
+            "HTTP response body bytes.",
+        ),
+    ):
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} counter"])
+        for key, summary in metrics.get("bytes", dict()).items():
+            method, _, route = key.partition(" ")
+            labels = _labels(method=method, route=route)
+            lines.append(f"{name}{{{labels}}} {summary[field]}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _merge_metrics(target: dict, metrics: dict):
+    requests = {tuple(item[:3]): item[3] for item in target["requests"]}
+    for method, route, status, count in metrics["requests"]:
+        key = (method, route, status)
+        requests[key] = requests.get(key, 0) + count
+    target["requests"] = [[*key, count] for key, count in requests.items()]
+
+    for key, histogram in metrics["latency"].items():
+        merged = target["latency"].setdefault(
+            key, {"counts": [0] * len(histogram["counts"]), "sum": 0.0}
+        )
+        merged["counts"] = [
+            a + b for a, b in zip(merged["counts"], histogram["counts"])
+        ]
+        merged["sum"] += histogram["sum"]
+
+    for key, summary in metrics.get("bytes", dict()).items():
+        merged = target["bytes"].setdefault(key, BytesSummary().snapshot())
+        for field in ("count", "request_bytes", "response_bytes", "response_chunks"):
+            merged[field] += summary[field]
+        merged["max_response_bytes"] = max(
+            merged["max_response_bytes"], summary["max_response_bytes"]
+        )
+
+
+def _compile_patterns(patterns: list[str] | None) -> re.Pattern | None:
+    if not patterns:
+        return None
+
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns))
+
+
+class LogfireSampler:
+    """logfire 事件采样
+
+    依次判断:
+        exclude/include: 路径通配符(如 "/static/*"), 排除的路径不发送, 设置 include 时只发送匹配的路径
+        keep_errors/slow_threshold: 5xx 响应与耗时超过 slow_threshold 秒的请求总是保留
+        rate: 其余请求按比例随机采样
+    max_per_second 为每秒发送数量的上限, 对总是保留的请求同样生效;
+    因采样与上限未发送的数量见 dropped
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        keep_errors: bool = True,
+        slow_threshold: float | None = None,
+        include: list[str] | None = None,
+        exclude: list[str] | None = None,
+        max_per_second: int | None = None,
+    ):
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError(f"Unsupported rate: {rate}")
+
+        self.rate = rate
+        self.keep_errors = keep_errors
+        self.slow_threshold = slow_threshold
+        self.max_per_second = max_per_second
+        self._include = _compile_patterns(include)
+        self._exclude = _compile_patterns(exclude)
+
+        self.dropped = 0
+        self._second = 0
+        self._second_count = 0
+
+    def sample(self, path: str, status_code: int, duration: float) -> bool:
+        if self._exclude is not None and self._exclude.match(path):
+            return False
+        if self._include is not None and not self._include.match(path):
+            return False
+
+        keep = (self.keep_errors and status_code >= 500) or (
+            self.slow_threshold is not None and duration >= self.slow_threshold
+        )
+        if not keep and self.rate < 1.0 and random.random() >= self.rate:
+            self.dropped += 1
+            return False
+
+        if self.max_per_second is not None:
+            second = int(time.monotonic())
+            if second != self._second:
+                self._second = second
+                self._second_count = 0
+            if self._second_count >= self.max_per_second:
+                self.dropped += 1
+                return False
+            self._second_count += 1
+
+        return True
+
+
+_ACCESS_LOG_FORMAT = '%s - "%s %s" %s %.1fms ttfb=%.1fms in=%dB out=%dB chunks=%d'
+# logfire 按属性填充模板
+_LOGFIRE_MESSAGE = "{remote_addr} {request_method} {request_path}"
+
+
+class _AccessLogQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # 有界队列已满时等待后台线程取出, 而不是抛出 queue.Full
+        self.queue.put(self._sentinel)
+
+
+class _AccessLogHandler(Handler):
+    """在 QueueListener 线程中输出访问日志与 logfire 事件"""
+
+    def __init__(self, middleware: "ASGIMiddlewareAccessLogging"):
+        super().__init__()
+        self.middleware = middleware
+
+    def emit(self, record: LogRecord):
+        self.middleware._emit(record)
+
+
+class LatencyHistogram:
+    """固定桶的延迟直方图(单位: 秒), 桶为累计前的各区间计数, 最后一个桶为 +Inf"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        return {
+            "buckets": self.buckets,
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class BytesSummary:
+    """请求体与响应体字节数的累计"""
+
+    def __init__(self):
+        self.count = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.response_chunks = 0
+        self.max_response_bytes = 0
+
+    def observe(self, request_bytes: int, response_bytes: int, response_chunks: int):
+        self.count += 1
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.response_chunks += response_chunks
+        if response_bytes > self.max_response_bytes:
+            self.max_response_bytes = response_bytes
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "response_chunks": self.response_chunks,
+            "max_response_bytes": self.max_response_bytes,
+        }
+
 
 class ASGIMiddlewareAccessLogging:
+    """ASGI 访问日志
+
+    记录请求总耗时(duration)与首字节时间(ttfb, 从请求开始到发送第一个响应体),
+    以及请求体字节数、响应体字节数与分块数(只计数, 不缓存数据),
+    并按 "{method} {route}" 统计延迟直方图与字节数, 见 latency_stats()/bytes_stats();
+    route 优先使用路由模板(scope["route"].path 或字符串 scope["route"]), 否则将路径中的
+    ID 类路径段替换为 {id}; 没有路由模板时, 尚未出现过的路径的非 2xx 响应(如扫描产生的 404)
+    合并到 "unmatched", 不占用路由数量; 路由数量超过 route_limit 后合并到 "other"
+
+    Django 不设置 scope["route"], 可在 Django 中间件中写入 URL 模式作为路由模板:
+
+        def route_middleware(get_response):
+            def middleware(request):
+                response = get_response(request)
+                if request.resolver_match is not None:
+                    request.scope["route"] = request.resolver_match.route
+                return response
+
+            return middleware
+
+    logfire_sampler: 设置 LOGFIRE_TOKEN 时, logfire 事件的采样规则, 默认全部发送
+
+    metrics_path: 设置后(如 "/metrics")以 Prometheus 文本格式输出请求计数与延迟直方图
+    metrics_dir: 多进程模式, 各进程由后台线程每 metrics_sync_interval 秒将统计写入该目录下的
+        {pid}.json, 输出时在线程池中合并所有进程的统计, 不在事件循环中读写文件; 目录需在部署时清空
+
+    log_mode:
+        sync: 在事件循环中直接输出
+        queue: 放入有界队列(log_queue_size), 由后台 QueueListener 线程输出;
+            队列满时的策略 log_drop_policy:
+                drop_newest: 丢弃新的日志
+                drop_oldest: 丢弃队列中最早的日志
+            丢弃的数量见 log_dropped
+    """
+
     logfire: bool = False
 
-    def __init__(self, app, remote_addr_header_name: str = "X-Forwarded-For") -> None:
+    # 延迟直方图的桶(秒)
+    latency_buckets: tuple[float, ...] = (
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    )
+    route_limit: int = 1000
+    metrics_sync_interval: float = 1.0
+
+    def __init__(
+        self,
+        app,
+        remote_addr_header_name: str = "X-Forwarded-For",
+        log_mode: Literal["sync", "queue"] = "sync",
+        log_queue_size: int = 10_000,
+        log_drop_policy: Literal["drop_newest", "drop_oldest"] = "drop_newest",
+        metrics_path: str | None = None,
+        metrics_dir: str | Path | None = None,
+        logfire_sampler: LogfireSampler | None = None,
+    ) -> None:
         self.logger = getLogger("ASGI")
         self.app = app
         # X-Forwarded-For/X-Real-IP
@@ -19,63 +332,347 @@ class ASGIMiddlewareAccessLogging:
         if logfire_token:
             logfire.configure(token=logfire_token)
             self.logfire = True
+        self.logfire_sampler = logfire_sampler
+
+        if log_mode not in ("sync", "queue"):
+            raise ValueError(f"Unsupported log_mode: {log_mode}")
+        if log_drop_policy not in ("drop_newest", "drop_oldest"):
+            raise ValueError(f"Unsupported log_drop_policy: {log_drop_policy}")
+
+        self.log_mode = log_mode
+        self.log_drop_policy = log_drop_policy
+        self.log_dropped = 0
+
+        self.latency_histograms: dict[str, LatencyHistogram] = dict()
+        self.bytes_summaries: dict[str, BytesSummary] = dict()
+        self.request_counts: dict[tuple[str, str, int], int] = dict()
+        self._routes: set[str] = set()
+
+        self.metrics_path = metrics_path
+        self.metrics_dir: Path | None = None
+        self._metrics_lock = threading.Lock()
+        self._metrics_stop = threading.Event()
+        self._metrics_thread: threading.Thread | None = None
+        if metrics_dir is not None:
+            self.metrics_dir = Path(metrics_dir)
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+            self._metrics_thread = threading.Thread(
+                target=self._sync_metrics_periodically,
+                name="ASGIMiddlewareMetrics",
+                daemon=True,
+            )
+            self._metrics_thread.start()
+            atexit.register(self.sync_metrics)
+
+        self._log_queue: queue.Queue | None = None
+        self._log_listener: QueueListener | None = None
+        if log_mode == "queue":
+            self._log_queue = queue.Queue(maxsize=log_queue_size)
+            self._log_listener = _AccessLogQueueListener(
+                self._log_queue, _AccessLogHandler(self)
+            )
+            self._log_listener.start()
+            # 进程退出时输出剩余的日志
+            atexit.register(self.close)
+
+    def close(self):
+        """停止后台线程, 输出队列中剩余的日志, 写入最后的统计"""
+        if self._metrics_thread is not None:
+            self._metrics_stop.set()
+            self._metrics_thread.join()
+            self._metrics_thread = None
+            self.sync_metrics()
+
+        if self._log_listener is None:
+            return
+
+        self._log_listener.stop()
+        self._log_listener = None
+        atexit.unregister(self.close)
 
     async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self.metrics_path is not None and scope["path"] == self.metrics_path:
+            await self._send_metrics(send)
+            return
+
         data = dict()
         data["response"] = {"status": 500}
+        data["first_body_time"] = None
+        data["request_bytes"] = 0
+        data["response_bytes"] = 0
+        data["response_chunks"] = 0
+
+        async def inner_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                data["request_bytes"] += len(message.get("body", b""))
+            return message
 
         async def inner_send(message) -> None:
             if message["type"] == "http.response.start":
                 data["response"] = message
+            elif message["type"] == "http.response.body":
+                if data["first_body_time"] is None:
+                    data["first_body_time"] = time.perf_counter()
+                data["response_bytes"] += len(message.get("body", b""))
+                data["response_chunks"] += 1
             await send(message)
 
+        start_time = time.perf_counter()
         try:
-            # info["start_time"] = time.time()
-            await self.app(scope, receive, inner_send)
-        except Exception as e:
-            # info["response"]["status"] = 500
-
-            raise e
-        finally:
-            # info["end_time"] = time.time()
-            pass
+            await self.app(scope, inner_receive, inner_send)
+        except Exception:
+            # 应用出错时按 500 记录, 再交给上层处理
+            data["response"] = {"status": 500}
+            self._record_request(scope, data, start_time, time.perf_counter())
+            raise
 
-        if scope["type"] != "http":
-            return
+        self._record_request(scope, data, start_time, time.perf_counter())
+
+    def _record_request(self, scope, data: dict, start_time: float, end_time: float):
+        request_method = scope["method"]
+        status_code = data["response"].get("status")
 
-        headers = scope.get("headers")
-        headers = dict(headers)
+        duration = end_time - start_time
+        first_body_time = data["first_body_time"] or end_time
+        ttfb = first_body_time - start_time
+        route = self._route(scope, status_code)
+        self._observe_latency(request_method, route, duration)
+        self._observe_bytes(request_method, route, data)
+        key = (request_method, route, status_code)
+        self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+        self._log_request(scope, request_method, status_code, duration, ttfb, data)
+
+    def _log_request(
+        self,
+        scope,
+        request_method: str,
+        status_code: int,
+        duration: float,
+        ttfb: float,
+        data: dict,
+    ):
+        log_enabled = self.logger.isEnabledFor(INFO)
+        send_logfire = self.logfire and (
+            self.logfire_sampler is None
+            or self.logfire_sampler.sample(scope["path"], status_code, duration)
+        )
+        if not log_enabled and not send_logfire:
+            return
 
-        remote_addr = self._get_remote_addr(scope, headers)
-        user_agent = headers.get(b"user-agent", b"").decode("utf-8")
+        # 只扫描一次 headers, 只取需要的值
+        forwarded = user_agent = None
+        for name, value in scope["headers"]:
+            if name == self.remote_addr_header_name:
+                forwarded = value
+            elif name == b"user-agent":
+                user_agent = value
 
-        request_method = scope.get("method")
-        request_path = scope.get("path")
+        remote_addr = self._get_remote_addr(scope, forwarded)
+        request_path = scope["path"]
         request_query_string = scope.get("query_string")
         if request_query_string:
             request_path += urllib.parse.unquote(request_query_string)
 
-        status_code = data["response"].get("status")
-
-        self.logger.info(
-            f'{remote_addr} - "{request_method} {request_path}" {status_code}'
+        # 日志参数在输出时才格式化
+        args = (
+            remote_addr,
+            request_method,
+            request_path,
+            status_code,
+            duration * 1000,
+            ttfb * 1000,
+            data["request_bytes"],
+            data["response_bytes"],
+            data["response_chunks"],
         )
-
-        if self.logfire:
-            logfire.info(
-                f"{remote_addr} {request_method} {request_path}",
+        logfire_attributes = None
+        if send_logfire:
+            logfire_attributes = dict(
                 remote_addr=remote_addr,
                 request_method=request_method,
                 request_path=request_path,
                 status_code=status_code,
-                user_agent=user_agent,
+                user_agent=user_agent.decode("utf-8") if user_agent else "",
+                duration_ms=duration * 1000,
+                ttfb_ms=ttfb * 1000,
+                request_bytes=data["request_bytes"],
+                response_bytes=data["response_bytes"],
+                response_chunks=data["response_chunks"],
             )
 
-    def _get_remote_addr(self, scope, headers: dict) -> str:
-        remote_addr = headers.get(self.remote_addr_header_name, b"").decode("latin1")
+        if self._log_queue is None:
+            if log_enabled:
+                self.logger.info(_ACCESS_LOG_FORMAT, *args)
+            if logfire_attributes is not None:
+                logfire.info(_LOGFIRE_MESSAGE, **logfire_attributes)
+            return
+
+        record = self.logger.makeRecord(
+            self.logger.name,
+            INFO,
+            __file__,
+            0,
+            _ACCESS_LOG_FORMAT,
+            args,
+            None,
+            extra={"logfire_attributes": logfire_attributes},
+        )
+        self._enqueue(record)
 
-        if remote_addr:
-            return remote_addr
+    def _enqueue(self, record: LogRecord):
+        try:
+            self._log_queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        self.log_dropped += 1
+        if self.log_drop_policy == "drop_newest":
+            return
+
+        try:
+            self._log_queue.get_nowait()
+            self._log_queue.put_nowait(record)
+        except (queue.Empty, queue.Full):
+            pass
+
+    def _emit(self, record: LogRecord):
+        if self.logger.isEnabledFor(record.levelno):
+            self.logger.handle(record)
+
+        if record.logfire_attributes is not None:
+            logfire.info(_LOGFIRE_MESSAGE, **record.logfire_attributes)
+
+    def _route(self, scope, status_code: int | None) -> str:
+        route = scope.get("route")
+        if not isinstance(route, str):
+            route = getattr(route, "path", None)
+        if not route:
+            route = _collapse_path(scope.get("path"))
+            # 未知路径的非 2xx 响应不占用路由数量
+            if route not in self._routes and not 200 <= (status_code or 0) < 300:
+                return "unmatched"
+
+        if route not in self._routes:
+            if len(self._routes) >= self.route_limit:
+                return "other"
+            self._routes.add(route)
+
+        return route
+
+    def _observe_latency(self, request_method: str, route: str, duration: float):
+        key = f"{request_method} {route}"
+        histogram = self.latency_histograms.get(key)
+        if histogram is None:
+            histogram = LatencyHistogram(self.latency_buckets)
+            self.latency_histograms[key] = histogram
+
+        histogram.observe(duration)
+
+    def _observe_bytes(self, request_method: str, route: str, data: dict):
+        key = f"{request_method} {route}"
+        summary = self.bytes_summaries.get(key)
+        if summary is None:
+            summary = BytesSummary()
+            self.bytes_summaries[key] = summary
+
+        summary.observe(
+            data["request_bytes"], data["response_bytes"], data["response_chunks"]
+        )
+
+    def bytes_stats(self) -> dict[str, dict]:
+        """各路由的请求体/响应体字节数汇总"""
+        # 可能在后台线程中调用, 先复制再遍历
+        return {
+            key: summary.snapshot()
+            for key, summary in list(self.bytes_summaries.items())
+        }
+
+    def latency_stats(self) -> dict[str, dict]:
+        """各路由的延迟直方图快照"""
+        return {
+            key: histogram.snapshot()
+            for key, histogram in list(self.latency_histograms.items())
+        }
+
+    def metrics_snapshot(self) -> dict:
+        """当前进程的请求计数、延迟直方图与字节数汇总"""
+        return {
+            "requests": [
+                [*key, count] for key, count in list(self.request_counts.items())
+            ],
+            "latency": {
+                key: {"counts": list(histogram.counts), "sum": histogram.sum}
+                for key, histogram in list(self.latency_histograms.items())
+            },
+            "bytes": self.bytes_stats(),
+        }
+
+    def sync_metrics(self):
+        """将当前进程的统计写入 metrics_dir"""
+        if self.metrics_dir is None:
+            return
+
+        path = self.metrics_dir.joinpath(f"{os.getpid()}.json")
+        tmp_path = path.with_suffix(".tmp")
+        with self._metrics_lock:
+            tmp_path.write_text(json.dumps(self.metrics_snapshot()))
+            tmp_path.replace(path)
+
+    def _sync_metrics_periodically(self):
+        while not self._metrics_stop.wait(self.metrics_sync_interval):
+            try:
+                self.sync_metrics()
+            except OSError as e:
+                self.logger.error(f"Write metrics file error: {e}")
+
+    def collect_metrics(self) -> dict:
+        """合并所有进程的统计, 非多进程模式时为当前进程的统计"""
+        if self.metrics_dir is None:
+            return self.metrics_snapshot()
+
+        self.sync_metrics()
+        metrics = {"requests": list(), "latency": dict(), "bytes": dict()}
+        for path in self.metrics_dir.glob("*.json"):
+            try:
+                _merge_metrics(metrics, json.loads(path.read_text()))
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Read metrics file {path} error: {e}")
+
+        return metrics
+
+    def _render_metrics(self) -> bytes:
+        return render_prometheus_metrics(
+            self.collect_metrics(), self.latency_buckets
+        ).encode("utf-8")
+
+    async def _send_metrics(self, send):
+        if self.metrics_dir is None:
+            body = self._render_metrics()
+        else:
+            # 多进程模式需要读写文件, 不阻塞事件循环
+            body = await asyncio.to_thread(self._render_metrics)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode("latin1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def _get_remote_addr(self, scope, forwarded: bytes | None) -> str:
+        if forwarded:
+            return forwarded.decode("latin1")
 
         remote_addr = scope.get("client")
         if remote_addr:
@@ -0,0 +1,171 @@
+"""ASGIMiddlewareAccessLogging 每个请求的开销
+
+LegacyAccessLogging 为精简每个请求的分配之前的 __call__(log_mode="sync"; 逐请求构造
+dict(headers)、提前解码 User-Agent 与格式化日志), 与当前实现对比; 当前实现另外包含
+请求体/响应体的字节统计. 分别在日志级别被过滤(WARNING)与输出到 NullHandler(INFO)时测量.
+
+节省只出现在 INFO 被过滤时(本机约 +8.4us -> +6.0us); 输出 INFO 日志时 LogRecord 的创建
+与格式化占主要开销, 两者相近(约 +19us)
+
+在仓库根目录运行:
+
+    python -m tests.by_hand.benchmark_logging_middleware
+"""
+
+import asyncio
+import logging
+import time
+import urllib.parse
+
+import logfire
+
+from django_vises.logging.middleware import ASGIMiddlewareAccessLogging
+
+REQUESTS = 50_000
+
+SCOPE = {
+    "type": "http",
+    "method": "GET",
+    "path": "/api/items/1",
+    "query_string": b"page=1&size=20",
+    "headers": [
+        (b"host", b"example.com"),
+        (b"accept", b"application/json"),
+        (b"accept-encoding", b"gzip, deflate, br"),
+        (b"accept-language", b"zh-CN,zh;q=0.9,en;q=0.8"),
+        (b"cookie", b"sessionid=abcdef0123456789; csrftoken=0123456789abcdef"),
+        (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36"),
+        (b"x-forwarded-for", b"10.0.0.1"),
+    ],
+    "client": ("127.0.0.1", 12345),
+}
+
+
+class LegacyAccessLogging(ASGIMiddlewareAccessLogging):
+    """旧实现的 __call__, 只保留 log_mode="sync" 的分支, 未设置 metrics_dir, 省略多进程统计的同步"""
+
+    async def __call__(self, scope, receive, send) -> None:
+        data = dict()
+        data["response"] = {"status": 500}
+        data["first_body_time"] = None
+
+        async def inner_send(message) -> None:
+            if message["type"] == "http.response.start":
+                data["response"] = message
+            elif (
+                message["type"] == "http.response.body"
+                and data["first_body_time"] is None
+            ):
+                data["first_body_time"] = time.perf_counter()
+            await send(message)
+
+        if (
+            self.metrics_path is not None
+            and scope["type"] == "http"
+            and scope.get("path") == self.metrics_path
+        ):
+            await self._send_metrics(send)
+            return
+
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, inner_send)
+        finally:
+            end_time = time.perf_counter()
+
+        if scope["type"] != "http":
+            return
+
+        headers = scope.get("headers")
+        headers = dict(headers)
+
+        remote_addr = headers.get(self.remote_addr_header_name, b"").decode("latin1")
+        if not remote_addr:
+            remote_addr = f"{scope['client'][0]}:{scope['client'][1]}"
+        user_agent = headers.get(b"user-agent", b"").decode("utf-8")
+
+        request_method = scope.get("method")
+        request_path = scope.get("path")
+        request_query_string = scope.get("query_string")
+        if request_query_string:
+            request_path += urllib.parse.unquote(request_query_string)
+
+        status_code = data["response"].get("status")
+
+        duration = end_time - start_time
+        first_body_time = data["first_body_time"] or end_time
+        ttfb = first_body_time - start_time
+        route = self._route(scope, status_code)
+        self._observe_latency(request_method, route, duration)
+        key = (request_method, route, status_code)
+        self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+        message = (
+            f'{remote_addr} - "{request_method} {request_path}" {status_code}'
+            f" {duration * 1000:.1f}ms ttfb={ttfb * 1000:.1f}ms"
+        )
+        logfire_attributes = None
+        if self.logfire and (
+            self.logfire_sampler is None
+            or self.logfire_sampler.sample(scope.get("path"), status_code, duration)
+        ):
+            logfire_attributes = dict(
+                remote_addr=remote_addr,
+                request_method=request_method,
+                request_path=request_path,
+                status_code=status_code,
+                user_agent=user_agent,
+                duration_ms=duration * 1000,
+                ttfb_ms=ttfb * 1000,
+            )
+
+        self.logger.info(message)
+        if logfire_attributes is not None:
+            logfire.info(
+                f"{remote_addr} {request_method} {request_path}",
+                **logfire_attributes,
+            )
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def bench(middleware) -> float:
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await middleware(SCOPE, receive, send)
+
+    return (time.perf_counter() - start) / REQUESTS * 1_000_000
+
+
+async def main():
+    logger = logging.getLogger("ASGI")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    await bench(app)
+    for level in (logging.WARNING, logging.INFO):
+        logger.setLevel(level)
+        baseline = await bench(app)
+        legacy = min([await bench(LegacyAccessLogging(app)) for _ in range(3)])
+        current = min([await bench(ASGIMiddlewareAccessLogging(app)) for _ in range(3)])
+        print(
+            f"{logging.getLevelName(level):8}"
+            f" app: {baseline:.2f}us"
+            f" legacy: +{legacy - baseline:.2f}us"
+            f" current: +{current - baseline:.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
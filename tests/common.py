@@ -1,5 +1,89 @@
+import gzip
+import time
+from http.server import BaseHTTPRequestHandler
 from os import getenv
 
 REDIS_URI = (
     f"redis://{getenv("REDIS_HOST", "localhost")}:{getenv("REDIS_PORT", "6379")}"
 )
+
+
+FLUX_CSV = (
+    "#datatype,string,long,dateTime:RFC3339,double,string,string\r\n"
+    "#group,false,false,false,false,true,true\r\n"
+    "#default,_result,,,,,\r\n"
+    ",result,table,_time,_value,_field,host\r\n"
+    + "".join(f",,0,2024-01-01T00:00:0{i}Z,{i}.5,usage,h{i}\r\n" for i in range(5))
+    + "\r\n"
+)
+
+
+# 两个类型不同的表, 含空值
+FLUX_CSV_MIXED = (
+    "#datatype,string,long,dateTime:RFC3339,long,string\r\n"
+    "#group,false,false,false,false,false\r\n"
+    "#default,_result,,,,\r\n"
+    ",result,table,_time,_value,host\r\n"
+    ",,0,2024-01-01T00:00:00Z,1,\r\n"
+    ",,0,2024-01-01T00:00:01Z,2,\r\n"
+    ",,0,2024-01-01T00:00:02Z,,\r\n"
+    "\r\n"
+    "#datatype,string,long,dateTime:RFC3339,double,string\r\n"
+    "#group,false,false,false,false,false\r\n"
+    "#default,_result,,,,\r\n"
+    ",result,table,_time,_value,host\r\n"
+    ",,1,2024-01-01T00:00:03Z,3.5,h3\r\n"
+    ",,1,,,h4\r\n"
+    "\r\n"
+)
+
+FLUX_CSV_LONG_DOUBLE = (
+    "#datatype,string,long,dateTime:RFC3339,long\r\n"
+    "#group,false,false,false,false\r\n"
+    "#default,_result,,,\r\n"
+    ",result,table,_time,_value\r\n"
+    ",,0,2024-01-01T00:00:00Z,1\r\n"
+    "\r\n"
+    "#datatype,string,long,dateTime:RFC3339,double\r\n"
+    "#group,false,false,false,false\r\n"
+    "#default,_result,,,\r\n"
+    ",result,table,_time,_value\r\n"
+    ",,1,2024-01-01T00:00:01Z,3.7\r\n"
+    "\r\n"
+)
+
+
+class FluxQueryHandler(BaseHTTPRequestHandler):
+    csv = FLUX_CSV
+    requests = 0
+    delay = 0.0
+    write_status = 204
+    writes: list[bytes] = list()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.startswith("/api/v2/write"):
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            if self.write_status != 204:
+                self.send_response(self.write_status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            FluxQueryHandler.writes.append(body)
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        FluxQueryHandler.requests += 1
+        time.sleep(self.delay)
+
+        body = self.csv.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,21 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from .common import FLUX_CSV, FluxQueryHandler
+
+
+@pytest.fixture
+def flux_url():
+    """返回一个固定 Flux 查询结果的本地 HTTP 服务。"""
+    FluxQueryHandler.requests = 0
+    FluxQueryHandler.delay = 0.0
+    FluxQueryHandler.csv = FLUX_CSV
+    FluxQueryHandler.write_status = 204
+    FluxQueryHandler.writes = list()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FluxQueryHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
@@ -0,0 +1,853 @@
+import socket
+import threading
+import time
+from datetime import UTC, datetime
+
+import pytest
+from influxdb_client.client.flux_table import FluxRecord
+from influxdb_client.rest import ApiException
+from urllib3.exceptions import ProtocolError
+
+from django_vises.db.influxdb2 import (
+    InfluxDBBackgroundWriter,
+    InfluxDBCollector,
+    InfluxDBConnect,
+    InfluxDBQueryCache,
+    InfluxDBSpool,
+    _column_to_numpy,
+    columns_to_line_protocol,
+)
+
+from .common import FLUX_CSV_LONG_DOUBLE, FLUX_CSV_MIXED, FluxQueryHandler
+
+
+def _raise(e: Exception):
+    raise e
+
+
+@pytest.fixture
+def influxdb_connect(flux_url):
+    with InfluxDBConnect(url=flux_url, org="org", bucket="bucket", token="token") as c:
+        yield c
+
+
+@pytest.fixture
+def unreachable_influxdb_connect():
+    with InfluxDBConnect(
+        url="http://127.0.0.1:1", org="org", bucket="bucket", token="token"
+    ) as c:
+        yield c
+
+
+class TestInfluxDBBackgroundWriter:
+    def test_flush_on_batch_size(self):
+        """测试达到 batch_size 时写入。"""
+        batches = list()
+        writer = InfluxDBBackgroundWriter(
+            batches.append, batch_size=2, flush_interval=60
+        )
+        writer.put([{"i": 1}, {"i": 2}, {"i": 3}])
+        time.sleep(0.1)
+        assert batches == [[{"i": 1}, {"i": 2}]]
+
+        writer.close()
+        assert batches == [[{"i": 1}, {"i": 2}], [{"i": 3}]]
+
+    def test_flush_on_interval(self):
+        """测试达到最大延迟时写入未满的批次。"""
+        batches = list()
+        writer = InfluxDBBackgroundWriter(
+            batches.append, batch_size=100, flush_interval=0.05
+        )
+        writer.put({"i": 1})
+        time.sleep(0.2)
+        assert batches == [[{"i": 1}]]
+        writer.close()
+
+    def test_flush(self):
+        """测试 flush 等待数据写入完成。"""
+        batches = list()
+        writer = InfluxDBBackgroundWriter(
+            batches.append, batch_size=100, flush_interval=60
+        )
+        writer.put({"i": 1})
+        assert writer.flush(timeout=1)
+        assert batches == [[{"i": 1}]]
+        writer.close()
+
+        with pytest.raises(RuntimeError):
+            writer.put({"i": 2})
+
+    @pytest.mark.parametrize(
+        "backpressure,expected", [("drop_oldest", [2, 3]), ("drop_newest", [0, 1])]
+    )
+    def test_drop(self, backpressure, expected):
+        """测试队列满时的丢弃策略。"""
+        blocker = threading.Event()
+        batches = list()
+
+        def write(batch):
+            blocker.wait()
+            batches.append(batch)
+
+        writer = InfluxDBBackgroundWriter(
+            write,
+            batch_size=1,
+            flush_interval=60,
+            max_queue_size=2,
+            backpressure=backpressure,
+        )
+        # 第一条数据被后台线程取走后阻塞在写入中
+        writer.put({"i": -1})
+        time.sleep(0.1)
+        writer.put([{"i": i} for i in range(4)])
+        assert writer.dropped == 2
+
+        blocker.set()
+        writer.close()
+        assert [batch[0]["i"] for batch in batches] == [-1, *expected]
+
+    def test_block(self):
+        """测试队列满时阻塞调用方, 直到后台线程写入。"""
+        batches = list()
+        writer = InfluxDBBackgroundWriter(
+            batches.append, batch_size=5, flush_interval=60, max_queue_size=10
+        )
+        done = threading.Event()
+
+        def put():
+            writer.put([{"i": i} for i in range(25)])
+            done.set()
+
+        threading.Thread(target=put, daemon=True).start()
+        assert done.wait(5)
+        writer.close()
+        assert [point["i"] for batch in batches for point in batch] == list(range(25))
+        assert writer.dropped == 0
+
+    def test_write_error(self):
+        """测试写入出错时后台线程继续运行。"""
+        batches = list()
+
+        def write(batch):
+            if batch[0]["i"] == 1:
+                raise ValueError
+            batches.append(batch)
+
+        writer = InfluxDBBackgroundWriter(write, batch_size=1, flush_interval=60)
+        writer.put([{"i": 1}, {"i": 2}])
+        writer.close()
+        assert batches == [[{"i": 2}]]
+
+
+class TestColumnsToLineProtocol:
+    def test_basic(self):
+        """测试列式数据转换为 line protocol。"""
+        assert columns_to_line_protocol(
+            "cpu",
+            tags={"host": ["a", "b"], "dc": ["x", "x"]},
+            fields={"value": [1.5, 2.0], "count": [1, 2], "ok": [True, False]},
+            timestamps=[1, 2],
+        ) == (
+            b"cpu,dc=x,host=a value=1.5,count=1i,ok=true 1\n"
+            b"cpu,dc=x,host=b value=2.0,count=2i,ok=false 2"
+        )
+
+    def test_escape(self):
+        """测试特殊字符转义。"""
+        assert columns_to_line_protocol(
+            "my measurement,1",
+            tags={"tag key": ["a=b,c"]},
+            fields={"field=key": ['say "hi" \\']},
+            timestamps=[1],
+        ) == (
+            b'my\\ measurement\\,1,tag\\ key=a\\=b\\,c field\\=key="say \\"hi\\" \\\\" 1'
+        )
+
+    def test_escape_trailing_backslash(self):
+        """测试结尾的反斜杠不会转义分隔符。"""
+        assert columns_to_line_protocol(
+            "m",
+            tags={"t": ["a\\"], "u": ["b"]},
+            fields={"f\\": [1]},
+            timestamps=[1],
+        ) == (b"m,t=a\\ ,u=b f\\ =1i 1")
+
+    def test_skip_empty_values(self):
+        """测试跳过空的 tag/field, 以及没有 field 的行。"""
+        assert columns_to_line_protocol(
+            "m",
+            tags={"t": [None, ""]},
+            fields={"a": [None, float("nan")], "b": [1.0, None]},
+            timestamps=[1, 2],
+        ) == (b"m b=1.0 1")
+
+    def test_timestamps(self):
+        """测试 datetime 时间戳与精度。"""
+        dt = datetime(2024, 1, 1, tzinfo=UTC)
+        assert (
+            columns_to_line_protocol(
+                "m", tags={}, fields={"v": [1]}, timestamps=[dt], precision="ms"
+            )
+            == b"m v=1i 1704067200000"
+        )
+
+        with pytest.raises(ValueError):
+            columns_to_line_protocol(
+                "m", tags={}, fields={"v": [1]}, timestamps=[1], precision="m"  # type: ignore
+            )
+
+    def test_length_mismatch(self):
+        """测试列长度不一致。"""
+        with pytest.raises(ValueError):
+            columns_to_line_protocol("m", tags={}, fields={"v": [1, 2]}, timestamps=[1])
+
+    def test_numpy(self):
+        """测试 NumPy 数组输入。"""
+        np = pytest.importorskip("numpy")
+        assert columns_to_line_protocol(
+            "m",
+            tags={"t": np.array(["a", "b"])},
+            fields={"f": np.array([1.5, 2.5]), "i": np.array([1, 2])},
+            timestamps=np.array(
+                ["1970-01-01T00:00:01", "1970-01-01T00:00:02"], dtype="datetime64[ns]"
+            ),
+        ) == (b"m,t=a f=1.5,i=1i 1000000000\nm,t=b f=2.5,i=2i 2000000000")
+
+    def test_numpy_precision(self):
+        """测试 NumPy datetime64 时间戳按 precision 换算。"""
+        np = pytest.importorskip("numpy")
+        timestamps = np.array(["2024-01-01T00:00:00"], dtype="datetime64[ns]")
+        for precision, expected in (
+            ("s", b"m v=1i 1704067200"),
+            ("ms", b"m v=1i 1704067200000"),
+            ("ns", b"m v=1i 1704067200000000000"),
+        ):
+            assert (
+                columns_to_line_protocol(
+                    "m",
+                    tags={},
+                    fields={"v": [1]},
+                    timestamps=timestamps,
+                    precision=precision,
+                )
+                == expected
+            )
+
+        assert (
+            columns_to_line_protocol(
+                "m",
+                tags={},
+                fields={"v": [1]},
+                timestamps=list(timestamps),
+                precision="s",
+            )
+            == b"m v=1i 1704067200"
+        )
+
+    def test_numpy_scalars(self):
+        """测试 list 中的 NumPy 标量按数值类型写入。"""
+        np = pytest.importorskip("numpy")
+        assert columns_to_line_protocol(
+            "m",
+            tags={},
+            fields={
+                "f": [np.float32(1.5)],
+                "i": [np.int16(2)],
+                "b": [np.bool_(True)],
+                "n": [np.float64("nan")],
+            },
+            timestamps=[1],
+        ) == (b"m f=1.5,i=2i,b=true 1")
+
+
+class TestInfluxDBConnectWrite:
+    def test_write_batch(self, flux_url):
+        """测试按数量批量写入。"""
+        with InfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token", write_batch_size=2
+        ) as c:
+            for i in range(3):
+                c.write({"measurement": "m", "fields": {"v": i}, "time": i})
+            assert FluxQueryHandler.writes == [b"m v=0i 0\nm v=1i 1"]
+
+        assert FluxQueryHandler.writes[-1] == b"m v=2i 2"
+
+    def test_write_background(self, flux_url):
+        """测试 background 模式使用独立的批量大小。"""
+        with InfluxDBConnect(
+            url=flux_url,
+            org="org",
+            bucket="bucket",
+            token="token",
+            write_mode="background",
+            flush_interval=60,
+        ) as c:
+            for i in range(10):
+                c.write({"measurement": "m", "fields": {"v": i}, "time": i})
+            c.flush()
+            assert len(FluxQueryHandler.writes) == 1
+            assert FluxQueryHandler.writes[0].count(b"\n") == 9
+
+    def test_write_columns_gzip(self, flux_url):
+        """测试列式写入与 gzip 压缩。"""
+        with InfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token", enable_gzip=True
+        ) as c:
+            c.write_columns(
+                "m", tags={"t": ["a", "b"]}, fields={"v": [1.5, 2.5]}, timestamps=[1, 2]
+            )
+
+        assert FluxQueryHandler.writes == [b"m,t=a v=1.5 1\nm,t=b v=2.5 2"]
+
+    def test_write_batch_threads(self, flux_url):
+        """测试多线程共享实例时批量数据不丢失、不重复。"""
+        with InfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token", write_batch_size=7
+        ) as c:
+
+            def worker(n):
+                for i in range(100):
+                    c.write({"measurement": "m", "fields": {"v": n * 100 + i}})
+
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        lines = b"\n".join(FluxQueryHandler.writes).split(b"\n")
+        assert sorted(lines) == sorted(f"m v={i}i".encode() for i in range(800))
+
+
+class TestInfluxDBCollector:
+    @pytest.mark.parametrize("unix", [True, False])
+    def test_collector(self, flux_url, tmp_path, unix):
+        """测试多个 worker 的数据经 collector 汇聚后批量写入。"""
+        address = str(tmp_path.joinpath("collector.sock")) if unix else ("127.0.0.1", 0)
+        with InfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token"
+        ) as target:
+            collector = InfluxDBCollector(target, address, flush_interval=0.2)
+            collector.start()
+
+            workers = [
+                InfluxDBConnect(
+                    url="http://127.0.0.1:1",
+                    org="org",
+                    bucket="bucket",
+                    token="token",
+                    write_mode="collector",
+                    collector_address=collector.address,
+                )
+                for _ in range(3)
+            ]
+            for n, worker in enumerate(workers):
+                worker.write({"measurement": "m", "fields": {"v": n}, "time": n})
+                worker.write_columns(
+                    "c", tags={}, fields={"v": [n]}, timestamps=[n], precision="s"
+                )
+
+            deadline = time.monotonic() + 5
+            while len(FluxQueryHandler.writes) < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            collector.close()
+            for worker in workers:
+                worker.__exit__(None, None, None)
+
+        assert sorted(FluxQueryHandler.writes) == [
+            b"c v=0i 0\nc v=1i 1\nc v=2i 2",
+            b"m v=0i 0\nm v=1i 1\nm v=2i 2",
+        ]
+        if unix:
+            assert not tmp_path.joinpath("collector.sock").exists()
+
+    def test_slow_collector_write(self, flux_url, tmp_path):
+        """测试 collector 写入缓慢时 worker 不被阻塞, 接收缓冲区满时直接写入。"""
+        release = threading.Event()
+        written = list()
+
+        class SlowConnect:
+            def _write(self, body, precision):
+                release.wait(10)
+                written.append(body)
+
+        collector = InfluxDBCollector(
+            SlowConnect(), str(tmp_path.joinpath("collector.sock")), batch_size=1  # type: ignore
+        )
+        collector.start()
+        worker = InfluxDBConnect(
+            url=flux_url,
+            org="org",
+            bucket="bucket",
+            token="token",
+            write_mode="collector",
+            collector_address=collector.address,
+        )
+        # 缩小发送缓冲区, 使 collector 更快地积压
+        worker._collector_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        try:
+            slowest = 0.0
+            for n in range(200):
+                start = time.monotonic()
+                worker.write({"measurement": "m", "fields": {"v": n}, "time": n})
+                slowest = max(slowest, time.monotonic() - start)
+
+            assert slowest < 1
+            assert FluxQueryHandler.writes
+        finally:
+            release.set()
+            collector.close()
+            worker.__exit__(None, None, None)
+
+        lines = b"\n".join(written + FluxQueryHandler.writes).split(b"\n")
+        assert sorted(lines) == sorted(f"m v={n}i {n}".encode() for n in range(200))
+
+    def test_datagram_split(self, tmp_path):
+        """测试超出单个数据报上限时按行拆分。"""
+        received = list()
+        address = str(tmp_path.joinpath("collector.sock"))
+        collector = InfluxDBCollector(None, address)  # type: ignore
+        collector._append = received.append
+        collector.start()
+
+        with InfluxDBConnect(
+            url="http://127.0.0.1:1",
+            org="org",
+            bucket="bucket",
+            token="token",
+            write_mode="collector",
+            collector_address=address,
+        ) as c:
+            c.collector_datagram_bytes = 20
+            c.write([{"measurement": "m", "fields": {"v": i}} for i in range(5)])
+
+        deadline = time.monotonic() + 5
+        while len(received) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        collector.close()
+
+        assert received == [b"ns\nm v=0i\nm v=1i", b"ns\nm v=2i\nm v=3i", b"ns\nm v=4i"]
+
+    def test_fallback(self, flux_url, tmp_path):
+        """测试 collector 不可用时直接写入。"""
+        with InfluxDBConnect(
+            url=flux_url,
+            org="org",
+            bucket="bucket",
+            token="token",
+            write_mode="collector",
+            collector_address=str(tmp_path.joinpath("missing.sock")),
+        ) as c:
+            c.write({"measurement": "m", "fields": {"v": 1}, "time": 1})
+
+        assert FluxQueryHandler.writes == [b"m v=1i 1"]
+
+        with pytest.raises(ValueError):
+            InfluxDBConnect(
+                url=flux_url,
+                org="org",
+                bucket="bucket",
+                token="token",
+                write_mode="collector",
+            )
+
+    def test_fallback_partial(self, flux_url, tmp_path):
+        """测试发送中途出错时只直接写入尚未发送的部分。"""
+        sent = list()
+
+        class Sock:
+            def sendto(self, data, address):
+                if sent:
+                    raise ConnectionRefusedError
+                sent.append(data)
+
+            def close(self):
+                pass
+
+        with InfluxDBConnect(
+            url=flux_url,
+            org="org",
+            bucket="bucket",
+            token="token",
+            write_mode="collector",
+            collector_address=str(tmp_path.joinpath("collector.sock")),
+        ) as c:
+            c._collector_sock.close()
+            c._collector_sock = Sock()
+            c.collector_datagram_bytes = 20
+            c.write([{"measurement": "m", "fields": {"v": i}} for i in range(5)])
+
+        assert sent == [b"ns\nm v=0i\nm v=1i"]
+        assert FluxQueryHandler.writes == [b"m v=2i\nm v=3i\nm v=4i"]
+
+
+class TestInfluxDBConnectQuery:
+    def test_query_with_columns(self, influxdb_connect):
+        """测试按列返回查询结果。"""
+        assert influxdb_connect.query_with_columns("q", ["host", "_value"]) == [
+            ["h0", 0.5],
+            ["h1", 1.5],
+            ["h2", 2.5],
+            ["h3", 3.5],
+            ["h4", 4.5],
+        ]
+
+    def test_query_stream(self, influxdb_connect):
+        """测试流式返回查询结果。"""
+        records = list(influxdb_connect.query_stream("q"))
+        assert [record.get_value() for record in records] == [0.5, 1.5, 2.5, 3.5, 4.5]
+
+        assert list(influxdb_connect.query_stream("q", cs=["host"])) == [
+            ["h0"],
+            ["h1"],
+            ["h2"],
+            ["h3"],
+            ["h4"],
+        ]
+
+    def test_query_stream_chunks(self, influxdb_connect):
+        """测试按固定大小分块流式返回。"""
+        chunks = list(influxdb_connect.query_stream("q", cs=["_value"], chunk_size=2))
+        assert chunks == [[[0.5], [1.5]], [[2.5], [3.5]], [[4.5]]]
+
+        stream = influxdb_connect.query_stream("q", chunk_size=2)
+        assert len(next(stream)) == 2
+        stream.close()
+
+    def test_query_columns_numpy(self, influxdb_connect):
+        """测试按列返回 NumPy 数组。"""
+        np = pytest.importorskip("numpy")
+        result = influxdb_connect.query_columns(
+            "q", ["_time", "_value", "host"], chunk_size=2
+        )
+        assert result["_time"].dtype == np.dtype("datetime64[ns]")
+        assert result["_time"][0] == np.datetime64("2024-01-01T00:00:00")
+        assert result["_value"].dtype == np.float64
+        assert result["_value"].tolist() == [0.5, 1.5, 2.5, 3.5, 4.5]
+        assert result["host"].tolist() == ["h0", "h1", "h2", "h3", "h4"]
+
+    def test_query_columns_arrow(self, influxdb_connect):
+        """测试按列返回 pyarrow.Table。"""
+        pa = pytest.importorskip("pyarrow")
+        table = influxdb_connect.query_columns(
+            "q", ["_time", "_value"], output="arrow", chunk_size=2
+        )
+        assert table.num_rows == 5
+        assert pa.types.is_timestamp(table.schema.field("_time").type)
+        assert table.schema.field("_value").type == pa.float64()
+
+    def test_query_columns_numpy_mixed_chunks(self, influxdb_connect):
+        """测试各分块类型不同(整数/浮点/全部为空)时统一列的类型。"""
+        np = pytest.importorskip("numpy")
+        FluxQueryHandler.csv = FLUX_CSV_MIXED
+        result = influxdb_connect.query_columns(
+            "q", ["_time", "_value", "host"], chunk_size=2
+        )
+        assert result["_time"].dtype == np.dtype("datetime64[ns]")
+        assert np.isnat(result["_time"][4])
+        assert result["_value"].dtype == np.float64
+        np.testing.assert_array_equal(result["_value"], [1.0, 2.0, np.nan, 3.5, np.nan])
+        assert result["host"].tolist() == [None, None, None, "h3", "h4"]
+
+        # 整数分块之后只有全空分块
+        result = influxdb_connect.query_columns("q", ["_value"], chunk_size=3)
+        assert result["_value"].dtype == np.float64
+
+    def test_query_columns_numpy_mixed_tables(self, influxdb_connect):
+        """测试同一分块内整数与浮点的 table 混合时不截断浮点。"""
+        np = pytest.importorskip("numpy")
+        FluxQueryHandler.csv = FLUX_CSV_LONG_DOUBLE
+        assert influxdb_connect.query_with_columns("q", ["_value"]) == [[1], [3.7]]
+
+        result = influxdb_connect.query_columns("q", ["_value"])
+        assert result["_value"].dtype == np.float64
+        assert result["_value"].tolist() == [1.0, 3.7]
+
+    def test_column_to_numpy_mixed_types(self):
+        """测试分块内的值类型不同时按所有的值决定类型。"""
+        np = pytest.importorskip("numpy")
+        assert _column_to_numpy(np, [1, 3.7]).tolist() == [1.0, 3.7]
+        assert _column_to_numpy(np, [1, "x"]).dtype == np.dtype(object)
+        assert _column_to_numpy(np, [True, 5]).tolist() == [True, 5]
+        assert _column_to_numpy(np, [True, 5]).dtype == np.dtype(object)
+        assert _column_to_numpy(np, [1, 2]).dtype == np.int64
+
+    def test_query_columns_arrow_mixed_chunks(self, influxdb_connect):
+        """测试 arrow 输出时整数与浮点分块、全空分块的合并。"""
+        pa = pytest.importorskip("pyarrow")
+        FluxQueryHandler.csv = FLUX_CSV_MIXED
+        table = influxdb_connect.query_columns(
+            "q", ["_time", "_value", "host"], output="arrow", chunk_size=2
+        )
+        assert table.schema.field("_value").type == pa.float64()
+        assert pa.types.is_timestamp(table.schema.field("_time").type)
+        assert table.schema.field("host").type == pa.string()
+        assert table.column("_value").to_pylist() == [1.0, 2.0, None, 3.5, None]
+
+    def test_query_columns_empty(self, unreachable_influxdb_connect):
+        """测试访问出错时返回空的列。"""
+        pytest.importorskip("numpy")
+        result = unreachable_influxdb_connect.query_columns("q", ["a"])
+        assert len(result["a"]) == 0
+
+        with pytest.raises(ValueError):
+            unreachable_influxdb_connect.query_columns("q", ["a"], output="list")  # type: ignore
+
+    def test_query_error(self, unreachable_influxdb_connect, caplog):
+        """测试访问出错时记录日志并返回空结果。"""
+        assert unreachable_influxdb_connect.query_with_columns("q", ["a"]) == []
+        assert list(unreachable_influxdb_connect.query_stream("q", cs=["a"])) == []
+        assert "InfluxDB access error" in caplog.text
+
+    def test_query_error_midstream(self, influxdb_connect, monkeypatch, caplog):
+        """测试已返回部分结果后出错时抛出异常, 不返回不完整的结果。"""
+        pytest.importorskip("numpy")
+
+        def query_stream(q):
+            yield FluxRecord(0, values={"_value": 0.5})
+            yield FluxRecord(0, values={"_value": 1.5})
+            raise ProtocolError("Connection broken")
+
+        monkeypatch.setattr(influxdb_connect._query_api, "query_stream", query_stream)
+
+        stream = influxdb_connect.query_stream("q", cs=["_value"])
+        assert next(stream) == [0.5]
+        with pytest.raises(ProtocolError):
+            list(stream)
+        assert "InfluxDB access error" in caplog.text
+
+        # 返回任何结果前出错, 与连接失败一样返回空结果
+        assert (
+            list(influxdb_connect.query_stream("q", cs=["_value"], chunk_size=10)) == []
+        )
+
+        with pytest.raises(ProtocolError):
+            influxdb_connect.query_columns("q", ["_value"], chunk_size=1)
+        assert len(influxdb_connect.query_columns("q", ["_value"])["_value"]) == 0
+
+
+class TestInfluxDBQueryCache:
+    def test_cache_hit(self, flux_url):
+        """测试相同查询命中缓存, 查询语句中的空白字符不影响 key。"""
+        cache = InfluxDBQueryCache(ttl=60)
+        with InfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token", query_cache=cache
+        ) as c:
+            result = c.query_with_columns('from(bucket: "b")', ["host"])
+            result.append("modified")
+            assert c.query_with_columns(' from(bucket:  "b")\n', ["host"]) == [
+                ["h0"],
+                ["h1"],
+                ["h2"],
+                ["h3"],
+                ["h4"],
+            ]
+            c.query_with_columns('from(bucket: "b  ")', ["host"])
+            c.query_with_columns('from(bucket: "b")', ["_value"])
+
+        assert FluxQueryHandler.requests == 3
+        assert cache.stats() == {"hits": 1, "misses": 3, "coalesced": 0, "size": 3}
+
+    def test_ttl_and_maxsize(self):
+        """测试过期与 LRU 淘汰。"""
+        calls = list()
+
+        def query():
+            calls.append(1)
+            return [[len(calls)]]
+
+        cache = InfluxDBQueryCache(ttl=0)
+        assert cache.get_or_query("q", [], query) == [[1]]
+        assert cache.get_or_query("q", [], query) == [[2]]
+
+        cache = InfluxDBQueryCache(ttl=60, maxsize=1)
+        cache.get_or_query("q1", [], query)
+        cache.get_or_query("q2", [], query)
+        cache.get_or_query("q1", [], query)
+        assert cache.misses == 3
+
+    def test_single_flight(self):
+        """测试并发的相同查询只访问一次。"""
+        calls = list()
+
+        def query():
+            calls.append(1)
+            time.sleep(0.2)
+            return [["v"]]
+
+        cache = InfluxDBQueryCache(ttl=60)
+        results = list()
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get_or_query("q", ["c"], query))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [[["v"]]] * 5
+        assert cache.coalesced == 4
+
+    def test_error_is_not_cached(self, unreachable_influxdb_connect):
+        """测试出错的查询不被缓存。"""
+        cache = InfluxDBQueryCache(ttl=60)
+        unreachable_influxdb_connect._query_cache = cache
+        assert unreachable_influxdb_connect.query_with_columns("q", ["a"]) == []
+        assert cache.stats()["size"] == 0
+
+    def test_django_cache(self):
+        """测试通过 Django cache 共享结果。"""
+        from django.conf import settings
+
+        if not settings.configured:
+            settings.configure(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+                    }
+                }
+            )
+
+        calls = list()
+
+        def query():
+            calls.append(1)
+            return [["v"]]
+
+        InfluxDBQueryCache(django_cache_alias="default").get_or_query("q", [], query)
+        cache = InfluxDBQueryCache(django_cache_alias="default")
+        assert cache.get_or_query("q", [], query) == [["v"]]
+        assert len(calls) == 1
+        assert cache.hits == 1
+
+
+class TestInfluxDBSpool:
+    def test_append_and_replay(self, tmp_path):
+        """测试暂存与重放。"""
+        spool = InfluxDBSpool(tmp_path)
+        spool.append(b"m v=1i 1")
+        spool.append(b"m v=2i 2")
+        spool.append(b"m v=3i 3", precision="s")
+        assert not spool.healthy
+        assert len(list(tmp_path.glob("*.lp"))) == 2
+
+        sent = list()
+        assert spool.replay(lambda body, precision: sent.append((body, precision)))
+        assert sent == [(b"m v=1i 1\nm v=2i 2\n", "ns"), (b"m v=3i 3\n", "s")]
+        assert spool.healthy
+        assert spool.size == 0
+
+    def test_replay_error(self, tmp_path):
+        """测试重放失败时保留暂存数据。"""
+        spool = InfluxDBSpool(tmp_path)
+        spool.append(b"m v=1i 1")
+
+        def send(body, precision):
+            raise ValueError
+
+        assert not spool.replay(send)
+        assert not spool.healthy
+        assert spool.size > 0
+
+    def test_replay_rejected(self, tmp_path):
+        """测试重放被拒绝(4xx)的分段被隔离, 不阻塞之后的分段。"""
+        spool = InfluxDBSpool(tmp_path)
+        spool.append(b"bad")
+        spool.append(b"m v=1i 1", precision="s")
+
+        sent = list()
+
+        def send(body, precision):
+            if body == b"bad\n":
+                raise ApiException(status=400)
+            sent.append(body)
+
+        assert spool.replay(send)
+        assert sent == [b"m v=1i 1\n"]
+        assert spool.healthy
+        assert [path.suffix for path in tmp_path.iterdir()] == [".rejected"]
+
+        # 5xx 可重试, 保留分段
+        spool.append(b"m v=2i 2")
+        assert not spool.replay(
+            lambda body, precision: _raise(ApiException(status=503))
+        )
+        assert not spool.healthy
+        assert spool.size > 0
+
+    def test_max_bytes(self, tmp_path):
+        """测试超出总大小时丢弃最早的分段。"""
+        spool = InfluxDBSpool(tmp_path, max_bytes=30, segment_bytes=10)
+        for i in range(5):
+            spool.append(f"m v={i}i {i}".encode())
+
+        # 每条 9 字节, 每个分段只能容纳一条
+        assert spool.size == 27
+        assert spool.dropped_bytes == 18
+        assert b"m v=0i 0" not in b"".join(
+            segment.read_bytes() for segment in tmp_path.glob("*.lp")
+        )
+
+        # 超过总大小的数据直接丢弃, 不影响已有的分段
+        spool.append(b"x" * 100)
+        assert spool.dropped_bytes == 119
+        assert spool.size == 27
+
+    def test_background_replay(self, tmp_path):
+        """测试后台线程按退避重放。"""
+        failures = [1]
+        sent = list()
+
+        def send(body, precision):
+            if failures:
+                failures.pop()
+                raise ValueError
+            sent.append(body)
+
+        spool = InfluxDBSpool(tmp_path, min_backoff=0.05)
+        spool.start(send)
+        spool.append(b"m v=1i 1")
+        time.sleep(0.3)
+        spool.close()
+
+        assert sent == [b"m v=1i 1\n"]
+        assert spool.healthy
+
+    def test_connect_rejected(self, flux_url, tmp_path):
+        """测试被 InfluxDB 拒绝的数据不进入暂存。"""
+        FluxQueryHandler.write_status = 400
+        spool = InfluxDBSpool(tmp_path, min_backoff=60)
+        with InfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token", spool=spool
+        ) as c:
+            with pytest.raises(ApiException):
+                c.write({"measurement": "m", "fields": {"v": 1}, "time": 1})
+            assert spool.healthy
+            assert spool.size == 0
+
+            FluxQueryHandler.write_status = 503
+            c.write({"measurement": "m", "fields": {"v": 1}, "time": 1})
+            assert not spool.healthy
+
+    def test_connect_spool_on_error(self, tmp_path):
+        """测试写入失败时数据进入暂存, 之后的写入不再访问 InfluxDB。"""
+        spool = InfluxDBSpool(tmp_path, min_backoff=60)
+        with InfluxDBConnect(
+            url="http://127.0.0.1:1",
+            org="org",
+            bucket="bucket",
+            token="token",
+            spool=spool,
+        ) as c:
+            c.write({"measurement": "m", "fields": {"v": 1}, "time": 1})
+            assert not spool.healthy
+            c.write_columns("m", tags={}, fields={"v": [2]}, timestamps=[2])
+
+        assert b"".join(
+            segment.read_bytes() for segment in sorted(tmp_path.glob("*.lp"))
+        ) == (b"m v=1i 1\nm v=2i 2\n")
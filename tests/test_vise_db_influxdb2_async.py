@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+from aiohttp import ClientPayloadError
+from influxdb_client.client.flux_table import FluxRecord
+
+from django_vises.db.influxdb2_async import AsyncInfluxDBConnect
+
+from .common import FluxQueryHandler
+
+
+class TestAsyncInfluxDBConnect:
+    async def test_write_batch(self, flux_url):
+        """测试异步批量写入。"""
+        async with AsyncInfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token", write_batch_size=2
+        ) as c:
+            for i in range(3):
+                await c.write({"measurement": "m", "fields": {"v": i}, "time": i})
+            assert FluxQueryHandler.writes == [b"m v=0i 0\nm v=1i 1"]
+
+        assert FluxQueryHandler.writes[-1] == b"m v=2i 2"
+
+    async def test_flush_interval(self, flux_url):
+        """测试定时写入未满的批次。"""
+        async with AsyncInfluxDBConnect(
+            url=flux_url,
+            org="org",
+            bucket="bucket",
+            token="token",
+            write_batch_size=100,
+            flush_interval=0.05,
+        ) as c:
+            await c.write({"measurement": "m", "fields": {"v": 1}, "time": 1})
+            await asyncio.sleep(0.2)
+            assert FluxQueryHandler.writes == [b"m v=1i 1"]
+
+    async def test_close_during_periodic_flush(self, flux_url):
+        """测试定时写入进行中时关闭, 不丢失已取出的批次。"""
+        sent = list()
+        c = AsyncInfluxDBConnect(
+            url=flux_url,
+            org="org",
+            bucket="bucket",
+            token="token",
+            write_batch_size=100,
+            flush_interval=0.05,
+        )
+
+        async def slow_write(data, precision="ns"):
+            await asyncio.sleep(0.2)
+            sent.extend(data)
+
+        c._write = slow_write
+        for i in range(3):
+            await c.write({"measurement": "m", "fields": {"v": i}, "time": i})
+        # 定时任务已取出批次, 正在写入
+        await asyncio.sleep(0.1)
+        await c.close()
+
+        assert [point["fields"]["v"] for point in sent] == [0, 1, 2]
+
+    async def test_write_columns_gzip(self, flux_url):
+        """测试列式写入与 gzip 压缩。"""
+        async with AsyncInfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token", enable_gzip=True
+        ) as c:
+            await c.write_columns(
+                "m", tags={"t": ["a"]}, fields={"v": [1.5]}, timestamps=[1]
+            )
+
+        assert FluxQueryHandler.writes == [b"m,t=a v=1.5 1"]
+
+    async def test_query(self, flux_url):
+        """测试异步查询。"""
+        async with AsyncInfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token"
+        ) as c:
+            assert await c.query_with_columns("q", ["host"]) == [
+                ["h0"],
+                ["h1"],
+                ["h2"],
+                ["h3"],
+                ["h4"],
+            ]
+            assert [row async for row in c.query_stream("q", cs=["_value"])] == [
+                [0.5],
+                [1.5],
+                [2.5],
+                [3.5],
+                [4.5],
+            ]
+            chunks = [
+                chunk async for chunk in c.query_stream("q", cs=["host"], chunk_size=2)
+            ]
+            assert chunks == [[["h0"], ["h1"]], [["h2"], ["h3"]], [["h4"]]]
+
+    async def test_query_error(self, caplog):
+        """测试访问出错时记录日志并返回空结果。"""
+        async with AsyncInfluxDBConnect(
+            url="http://127.0.0.1:1", org="org", bucket="bucket", token="token"
+        ) as c:
+            assert await c.query_with_columns("q", ["a"]) == []
+            assert [row async for row in c.query_stream("q")] == []
+
+        assert "InfluxDB access error" in caplog.text
+
+    async def test_query_error_midstream(self, flux_url, caplog):
+        """测试已返回部分结果后出错时抛出异常。"""
+
+        async def records():
+            yield FluxRecord(0, values={"_value": 0.5})
+            raise ClientPayloadError("Response payload is not completed")
+
+        async def query_stream(q):
+            return records()
+
+        async with AsyncInfluxDBConnect(
+            url=flux_url, org="org", bucket="bucket", token="token"
+        ) as c:
+            c._query_api.query_stream = query_stream
+
+            stream = c.query_stream("q", cs=["_value"])
+            assert await anext(stream) == [0.5]
+            with pytest.raises(ClientPayloadError):
+                await anext(stream)
+
+            assert [chunk async for chunk in c.query_stream("q", chunk_size=10)] == []
+
+        assert "InfluxDB access error" in caplog.text
@@ -1,8 +1,28 @@
+import time
 from uuid import UUID, uuid4
 
 import pytest
-
-from django_vises.db.redis_set import RedisSetInt, RedisSetStr, RedisSetUUID
+import redis
+
+from django_vises.db.redis_set import (
+    AsyncRedisSetInt,
+    AsyncRedisSetStr,
+    AsyncRedisSetUUID,
+    RedisBloomFilterInt,
+    RedisBloomFilterStr,
+    RedisExpiringSetStr,
+    RedisExpiringSetUUID,
+    RedisHyperLogLogInt,
+    RedisHyperLogLogUUID,
+    RedisSetInt,
+    RedisSetLocalCache,
+    RedisSetStr,
+    RedisSetUUID,
+    RedisShardedSetInt,
+    RedisShardedSetStr,
+    get_connection_pool,
+    get_connection_pools_stats,
+)
 
 from .common import REDIS_URI
 
@@ -101,6 +121,88 @@ class TestRedisSetStr:
     def test_as_set(self, default_set_str, test_values_str):
         assert default_set_str == set(test_values_str)
 
+    def test_add_many_and_discard_many(self, empty_set_str):
+        """测试批量添加与批量移除。"""
+        assert empty_set_str.add_many(["a", "b", "c", "a"]) == 3
+        assert len(empty_set_str) == 3
+
+        assert empty_set_str.discard_many(["a", "x"]) == 1
+        assert set(empty_set_str) == {"b", "c"}
+
+    def test_add_many_chunked(self, empty_set_str):
+        """测试超过分块大小的批量添加。"""
+        empty_set_str.bulk_chunk_size = 10
+        empty_set_str.add_many(str(i) for i in range(95))
+        assert len(empty_set_str) == 95
+
+    def test_add_many_type_enforcement(self, empty_set_str):
+        """测试批量添加时的类型检查, 出错时不写入任何成员。"""
+        with pytest.raises(TypeError):
+            empty_set_str.add_many(["a", 1, "b"])  # type: ignore
+
+        assert len(empty_set_str) == 0
+
+    def test_update_and_difference_update(self, default_set_str):
+        """测试 update/difference_update。"""
+        default_set_str.update(["date"], ("elderberry",))
+        assert len(default_set_str) == 5
+
+        default_set_str.difference_update(["apple"], ["date"])
+        assert set(default_set_str) == {"banana", "cherry", "elderberry"}
+
+    def test_inplace_operators(self, default_set_str):
+        """测试 |= 与 -= 运算符。"""
+        default_set_str |= {"date"}
+        assert "date" in default_set_str
+
+        default_set_str -= {"apple", "date"}
+        assert set(default_set_str) == {"banana", "cherry"}
+
+        default_set_str -= default_set_str
+        assert len(default_set_str) == 0
+
+    def test_iteration_with_small_scan_count(self, empty_set_str):
+        """测试 SSCAN 分批迭代。"""
+        empty_set_str.scan_count = 7
+        expected = {str(i) for i in range(100)}
+        empty_set_str.add_many(expected)
+        assert set(empty_set_str) == expected
+
+    def test_repr_truncated(self, empty_set_str):
+        """测试 __repr__ 截断。"""
+        empty_set_str.repr_limit = 5
+        empty_set_str.add_many(str(i) for i in range(10))
+        items = repr(empty_set_str).split(", ")
+        assert len(items) == 6
+        assert items[-1] == "..."
+
+    def test_snapshot(self, default_set_str, test_values_str):
+        """测试 snapshot 方法。"""
+        assert default_set_str.snapshot() == set(test_values_str)
+
+    def test_contains_many(self, default_set_str):
+        """测试批量成员资格检查, 非法类型视为不存在。"""
+        assert default_set_str.contains_many(["apple", "grape", 1, "cherry"]) == [
+            True,
+            False,
+            False,
+            True,
+        ]
+        assert default_set_str.contains_many([]) == []
+
+    def test_contains_many_chunked(self, empty_set_str):
+        """测试超过分块大小的批量成员资格检查。"""
+        empty_set_str.bulk_chunk_size = 10
+        empty_set_str.add_many(str(i) for i in range(0, 100, 2))
+        result = empty_set_str.contains_many(str(i) for i in range(100))
+        assert result == [i % 2 == 0 for i in range(100)]
+
+    def test_filter_members(self, default_set_str):
+        """测试 filter_members 保持输入顺序。"""
+        assert default_set_str.filter_members(
+            ["cherry", "grape", "apple", "cherry"]
+        ) == ["cherry", "apple", "cherry"]
+
 
 @pytest.fixture
 def test_values_int():
@@ -165,6 +267,9 @@ class TestRedisSetInt:
         with pytest.raises(TypeError):
             empty_set_int.add(3.14)
 
+        with pytest.raises(TypeError):
+            empty_set_int.add(True)
+
     def test_initialization_with_non_int_raises_error(
         self,
     ):
@@ -183,6 +288,24 @@ class TestRedisSetInt:
         for item in default_set_int:
             assert isinstance(item, int)
 
+    def test_intset_encoding(self):
+        """测试 intset 编码的取值范围检查。"""
+        s = RedisSetInt((2**63 - 1, -(2**63)), redis_uri=REDIS_URI, encoding="intset")
+        assert len(s) == 2
+
+        with pytest.raises(ValueError):
+            s.add(2**63)
+        assert 2**63 not in s
+
+    def test_contains_many(self, default_set_int):
+        """测试批量成员资格检查。"""
+        assert default_set_int.contains_many([10, 11, "20", 30]) == [
+            True,
+            False,
+            False,
+            True,
+        ]
+
 
 @pytest.fixture
 def test_values_uuid():
@@ -271,3 +394,442 @@ class TestRedisSetUUID:
         """测试 __repr__ 方法。"""
         items = [UUID(item) for item in repr(default_set_uuid).split(", ")]
         assert set(items) == set(test_values_uuid)
+
+    def test_filter_members(self, default_set_uuid, test_values_uuid):
+        """测试 filter_members 方法。"""
+        u1, _, u3 = test_values_uuid
+        assert default_set_uuid.filter_members([uuid4(), u3, u1]) == [u3, u1]
+
+    def test_bytes_encoding(self, test_values_uuid):
+        """测试 bytes 编码。"""
+        s = RedisSetUUID(test_values_uuid, redis_uri=REDIS_URI, encoding="bytes")
+        assert s.snapshot() == set(test_values_uuid)
+        assert set(s) == set(test_values_uuid)
+        assert test_values_uuid[0] in s
+        assert uuid4() not in s
+        assert all(len(item) == 16 for item in s._all())
+
+    def test_unsupported_encoding(self):
+        """测试不支持的编码。"""
+        with pytest.raises(ValueError):
+            RedisSetUUID(redis_uri=REDIS_URI, encoding="base64")  # type: ignore
+
+    def test_migrate_encoding(self, default_set_uuid, test_values_uuid):
+        """测试将 hex 编码的集合原地转换为 bytes 编码。"""
+        s = RedisSetUUID(clear=False, redis_uri=REDIS_URI, encoding="bytes")
+        s.bulk_chunk_size = 2
+        assert s.migrate_encoding() == 3
+        assert s.migrate_encoding() == 0
+        assert len(s) == 3
+        assert all(len(item) == 16 for item in s._all())
+        assert s.snapshot() == set(test_values_uuid)
+
+    def test_different_encoding_is_not_compatible(self, default_set_uuid):
+        """测试编码不同的集合不在服务端运算。"""
+        s = RedisSetUUID(
+            default_set_uuid,
+            redis_uri=REDIS_URI,
+            redis_set_name="set_b",
+            encoding="bytes",
+        )
+        assert not s._is_compatible(default_set_uuid)
+        assert s == default_set_uuid
+
+
+@pytest.fixture
+def set_int_a():
+    return RedisSetInt((1, 2, 3, 4), redis_uri=REDIS_URI, redis_set_name="set_a")
+
+
+@pytest.fixture
+def set_int_b():
+    return RedisSetInt((3, 4, 5), redis_uri=REDIS_URI, redis_set_name="set_b")
+
+
+class TestRedisSetAlgebra:
+    def test_binary_operators(self, set_int_a, set_int_b):
+        """测试服务端计算的 & | - ^ 运算。"""
+        assert set_int_a & set_int_b == {3, 4}
+        assert set_int_a | set_int_b == {1, 2, 3, 4, 5}
+        assert set_int_a - set_int_b == {1, 2}
+        assert set_int_a ^ set_int_b == {1, 2, 5}
+
+    def test_binary_operators_with_python_set(self, set_int_a):
+        """测试与 Python set 混合运算时的回退实现。"""
+        assert set_int_a & {3, 4, 5} == {3, 4}
+        assert set_int_a | {5} == {1, 2, 3, 4, 5}
+        assert set_int_a - {1} == {2, 3, 4}
+        assert set_int_a ^ {4, 5} == {1, 2, 3, 5}
+
+    def test_inplace_operators(self, set_int_a, set_int_b):
+        """测试服务端计算的原地运算。"""
+        set_int_a &= set_int_b
+        assert set_int_a.snapshot() == {3, 4}
+
+        set_int_a |= set_int_b
+        assert set_int_a.snapshot() == {3, 4, 5}
+
+        set_int_a.add(9)
+        set_int_a ^= set_int_b
+        assert set_int_a.snapshot() == {9}
+
+        set_int_a |= set_int_b
+        set_int_a -= set_int_b
+        assert set_int_a.snapshot() == {9}
+
+    def test_comparisons(self, set_int_a, set_int_b):
+        """测试 isdisjoint 与子集/相等比较。"""
+        assert not set_int_a.isdisjoint(set_int_b)
+        assert not set_int_a <= set_int_b
+        assert not set_int_a == set_int_b
+
+        set_int_b -= set_int_b
+        set_int_b.add_many([1, 2])
+        assert set_int_b <= set_int_a
+        assert set_int_b < set_int_a
+        assert set_int_a >= set_int_b
+        assert set_int_a > set_int_b
+        assert not set_int_a <= set_int_b
+
+        set_int_b.add_many([3, 4])
+        assert set_int_a == set_int_b
+        assert not set_int_a < set_int_b
+
+        set_int_b.clear()
+        set_int_b.add(7)
+        assert set_int_a.isdisjoint(set_int_b)
+
+    def test_different_type_is_not_compatible(self, set_int_a):
+        """测试不同类型的集合不在服务端运算。"""
+        set_str = RedisSetStr(("1", "2"), redis_uri=REDIS_URI, redis_set_name="set_c")
+        assert set_int_a & set_str == set()
+
+    def test_store(self, set_int_a, set_int_b):
+        """测试 *STORE 物化结果与 SINTERCARD。"""
+        result = set_int_a.intersection_store("set_d", set_int_b)
+        assert isinstance(result, RedisSetInt)
+        assert result.name == "set_d"
+        assert result.snapshot() == {3, 4}
+
+        assert set_int_a.union_store("set_d", set_int_b).snapshot() == {1, 2, 3, 4, 5}
+        assert set_int_a.difference_store("set_d", set_int_b).snapshot() == {1, 2}
+        assert set_int_a.intersection_len(set_int_b) == 2
+
+        with pytest.raises(TypeError):
+            set_int_a.union_store("set_d", {1, 2})
+
+
+class TestRedisSetConnectionPool:
+    def test_shared_pool_by_uri(self):
+        """测试相同 redis_uri 的实例共享连接池。"""
+        set_a = RedisSetStr(redis_uri=REDIS_URI, redis_set_name="set_a")
+        set_b = RedisSetInt(redis_uri=REDIS_URI, redis_set_name="set_b")
+        assert set_a._conn.connection_pool is set_b._conn.connection_pool
+        assert set_a._conn.connection_pool is get_connection_pool(REDIS_URI)
+
+    def test_redis_client_and_connection_pool(self):
+        """测试传入已有的 redis.Redis 或 ConnectionPool。"""
+        client = redis.Redis.from_url(REDIS_URI)
+        set_a = RedisSetStr(("a",), redis_set_name="set_a", redis_client=client)
+        assert set_a._conn is client
+        assert "a" in set_a
+
+        pool = redis.ConnectionPool.from_url(REDIS_URI)
+        set_b = RedisSetStr(("b",), redis_set_name="set_b", connection_pool=pool)
+        assert set_b._conn.connection_pool is pool
+        assert set_b.pool_stats()["created"] == 1
+
+    def test_pool_stats(self):
+        """测试连接池统计。"""
+        RedisSetStr(("a",), redis_uri=REDIS_URI)
+        stats = get_connection_pools_stats()[REDIS_URI]
+        assert stats["created"] >= 1
+        assert stats["in_use"] == 0
+        assert stats["available"] == stats["created"]
+
+    def test_blocking_pool_stats(self):
+        """测试 BlockingConnectionPool 的统计。"""
+        pool = redis.BlockingConnectionPool.from_url(REDIS_URI, max_connections=5)
+        s = RedisSetStr(("a",), redis_set_name="set_blocking", connection_pool=pool)
+        assert s.pool_stats() == {"created": 1, "in_use": 0, "available": 1, "max": 5}
+
+        connection = pool.get_connection()
+        assert s.pool_stats()["in_use"] == 1
+        pool.release(connection)
+
+
+class TestAsyncRedisSet:
+    async def test_str(self):
+        """测试异步集合的基本操作。"""
+        s = await AsyncRedisSetStr.create(("apple", "banana"), redis_uri=REDIS_URI)
+        assert await s.len() == 2
+        assert await s.contains("apple")
+        assert not await s.contains(1)
+
+        await s.add("cherry")
+        await s.discard("apple")
+        assert {item async for item in s} == {"banana", "cherry"}
+        assert await s.snapshot() == {"banana", "cherry"}
+
+        with pytest.raises(TypeError):
+            await s.add(1)
+
+        await s.clear()
+        assert await s.len() == 0
+        await s.aclose()
+
+    async def test_int_bulk(self):
+        """测试异步集合的批量操作。"""
+        s = await AsyncRedisSetInt.create(redis_uri=REDIS_URI)
+        s.bulk_chunk_size = 10
+        s.scan_count = 7
+
+        assert await s.add_many(range(100)) == 100
+        assert await s.discard_many(range(50, 100)) == 50
+        assert sorted([item async for item in s]) == list(range(50))
+
+        await s.update([100], [101])
+        await s.difference_update([0, 1])
+        assert await s.len() == 50
+        assert await s.contains_many([100, 0, "2", 2]) == [True, False, False, True]
+        assert await s.filter_members([200, 101, 3]) == [101, 3]
+
+        with pytest.raises(TypeError):
+            await s.add_many([1, "a"])
+        await s.aclose()
+
+    async def test_uuid(self):
+        """测试异步 UUID 集合。"""
+        u1, u2 = uuid4(), uuid4()
+        s = await AsyncRedisSetUUID.create((u1,), redis_uri=REDIS_URI)
+        assert await s.contains(u1)
+        assert not await s.contains(u2)
+        assert [item async for item in s] == [u1]
+        await s.aclose()
+
+
+class TestRedisSetLocalCache:
+    def test_full_mode(self):
+        """测试缓存整个集合。"""
+        cache = RedisSetLocalCache(mode="full")
+        s = RedisSetStr(("a", "b"), redis_uri=REDIS_URI, local_cache=cache)
+        assert "a" in s
+        assert "c" not in s
+        assert s.contains_many(["a", "b", "c"]) == [True, True, False]
+        assert cache.stats() == {"hits": 4, "misses": 1, "size": 2}
+
+        # 本实例的写操作使缓存失效
+        s.add("c")
+        assert "c" in s
+        assert cache.misses == 2
+
+    def test_lru_mode(self):
+        """测试缓存成员检查结果。"""
+        cache = RedisSetLocalCache(mode="lru", maxsize=2)
+        s = RedisSetInt((1, 2, 3), redis_uri=REDIS_URI, local_cache=cache)
+        assert s.contains_many([1, 4]) == [True, False]
+        assert 1 in s
+        assert cache.hits == 1
+        assert cache.misses == 2
+
+        assert 3 in s
+        assert cache.stats()["size"] == 2
+        # 4 已被淘汰
+        assert 4 not in s
+        assert cache.misses == 4
+
+        s.discard(1)
+        assert 1 not in s
+
+    def test_ttl(self):
+        """测试其他客户端的修改在 ttl 后可见。"""
+        cache = RedisSetLocalCache(mode="full", ttl=0)
+        s = RedisSetStr(("a",), redis_uri=REDIS_URI, local_cache=cache)
+        assert "b" not in s
+
+        RedisSetStr(clear=False, redis_uri=REDIS_URI).add("b")
+        assert "b" in s
+
+    def test_unsupported_mode(self):
+        """测试不支持的缓存模式。"""
+        with pytest.raises(ValueError):
+            RedisSetLocalCache(mode="unknown")  # type: ignore
+
+
+class TestRedisExpiringSet:
+    def test_basic(self):
+        """测试带过期时间集合的基本操作。"""
+        s = RedisExpiringSetStr(("a", "b"), ttl=60, redis_uri=REDIS_URI)
+        assert len(s) == 2
+        assert "a" in s
+        assert "c" not in s
+        assert set(s) == {"a", "b"}
+        assert s.snapshot() == {"a", "b"}
+        assert s.contains_many(["a", "c"]) == [True, False]
+
+        s.discard("a")
+        assert set(s) == {"b"}
+
+        with pytest.raises(TypeError):
+            s.add(1)  # type: ignore
+
+    def test_expired_members_are_hidden(self):
+        """测试过期成员对成员检查与迭代不可见。"""
+        s = RedisExpiringSetStr(("a",), ttl=60, redis_uri=REDIS_URI)
+        s.add("b", ttl=-1)
+        s.add_many(["c", "d"], ttl=-1)
+
+        assert len(s) == 1
+        assert "b" not in s
+        assert s.contains_many(["a", "b", "c"]) == [True, False, False]
+        assert set(s) == {"a"}
+        assert repr(s) == "a"
+        assert s == {"a"}
+
+    def test_trim(self):
+        """测试按批次清理过期成员。"""
+        s = RedisExpiringSetStr(ttl=-1, redis_uri=REDIS_URI)
+        s.trim_batch_size = 3
+        # 首次写入触发一次惰性清理, 之后 trim_interval 内不再自动清理
+        s.add_many(str(i) for i in range(5))
+        assert s._conn.zcard(s.name) == 2
+        s.add_many(str(i) for i in range(5, 10))
+        s.add("live", ttl=60)
+
+        assert s.trim() == 3
+        assert s.trim() == 3
+        assert s.trim() == 1
+        assert s.trim() == 0
+        assert s._conn.zcard(s.name) == 1
+
+    def test_trim_keeps_renewed(self):
+        """测试清理时不移除已续期的成员。"""
+        s = RedisExpiringSetStr(ttl=-1, redis_uri=REDIS_URI)
+        s.trim_interval = 60
+        # 之后 trim_interval 内不再自动清理
+        s.trim()
+        s.add_many(["a", "b"])
+        s.add("a", ttl=60)
+
+        assert s.trim() == 1
+        assert set(s) == {"a"}
+
+    def test_lazy_trim_on_write(self):
+        """测试写入时的惰性清理。"""
+        s = RedisExpiringSetUUID(ttl=0.01, redis_uri=REDIS_URI, encoding="bytes")
+        s.trim_interval = 0
+        s.add_many([uuid4(), uuid4()])
+        time.sleep(0.02)
+
+        u = uuid4()
+        s.add(u, ttl=60)
+        assert s._conn.zcard(s.name) == 1
+        assert list(s) == [u]
+
+
+class TestRedisBloomFilter:
+    def test_membership(self):
+        """测试 Bloom filter 的成员检查。"""
+        bf = RedisBloomFilterStr(
+            ("apple", "banana"), redis_uri=REDIS_URI, capacity=1000, error_rate=0.01
+        )
+        assert "apple" in bf
+        assert "banana" in bf
+        assert bf.contains_many(["apple", 1, "banana"]) == [True, False, True]
+
+        assert bf.add("cherry")
+        assert not bf.add("cherry")
+        assert "cherry" in bf
+
+        with pytest.raises(TypeError):
+            bf.add(1)  # type: ignore
+
+        bf.clear()
+        assert "apple" not in bf
+
+    def test_error_rate(self):
+        """测试误判率在设定范围内。"""
+        bf = RedisBloomFilterInt(redis_uri=REDIS_URI, capacity=1000, error_rate=0.01)
+        assert bf.add_many(range(1000)) >= 990
+        assert all(bf.contains_many(range(1000)))
+
+        false_positives = sum(bf.contains_many(range(1000, 11000)))
+        assert false_positives < 300
+
+    def test_invalid_arguments(self):
+        """测试非法的构造参数。"""
+        with pytest.raises(ValueError):
+            RedisBloomFilterStr(redis_uri=REDIS_URI, error_rate=1)
+
+        with pytest.raises(ValueError):
+            RedisBloomFilterStr(redis_uri=REDIS_URI, capacity=0)
+
+
+class TestRedisHyperLogLog:
+    def test_count(self):
+        """测试 HyperLogLog 去重计数。"""
+        hll = RedisHyperLogLogInt(redis_uri=REDIS_URI)
+        hll.bulk_chunk_size = 100
+        assert hll.add_many(range(1000))
+        assert hll.add(5000)
+        assert not hll.add(5000)
+        assert abs(len(hll) - 1001) < 50
+
+        with pytest.raises(TypeError):
+            hll.add("a")  # type: ignore
+
+    def test_merge(self):
+        """测试 PFCOUNT 并集与 PFMERGE。"""
+        u1, u2, u3 = uuid4(), uuid4(), uuid4()
+        hll_a = RedisHyperLogLogUUID((u1, u2), redis_uri=REDIS_URI)
+        hll_b = RedisHyperLogLogUUID(
+            (u2, u3), redis_uri=REDIS_URI, redis_set_name="hll_b"
+        )
+        assert hll_a.count_union(hll_b) == 3
+
+        hll_a.merge(hll_b)
+        assert len(hll_a) == 3
+        assert len(hll_b) == 2
+
+
+class TestRedisShardedSet:
+    def test_basic(self):
+        """测试分片集合的基本操作。"""
+        s = RedisShardedSetInt(range(100), shards=4, redis_uri=REDIS_URI)
+        assert len(s) == 100
+        assert 10 in s
+        assert 100 not in s
+        assert s.contains_many([1, 200, 99]) == [True, False, True]
+        assert set(s) == set(range(100))
+        assert s.snapshot() == set(range(100))
+
+        # 成员分散在所有子 key 中
+        cards = [s._conn.scard(name) for name in s._shard_names()]
+        assert all(card > 0 for card in cards)
+        assert sum(cards) == 100
+
+        s.discard(10)
+        assert s.discard_many(range(50, 100)) == 50
+        assert len(s) == 49
+        assert s == set(range(50)) - {10}
+
+        s.clear()
+        assert len(s) == 0
+        assert s._conn.exists(*s._shard_names()) == 0
+
+    def test_hash_tag(self):
+        """测试 cluster hash tag 形式的子 key。"""
+        s = RedisShardedSetStr(
+            ("a",),
+            shards=2,
+            hash_tag=True,
+            redis_uri=REDIS_URI,
+            redis_set_name="sharded",
+        )
+        assert s._shard_names() == ["{sharded}:0", "{sharded}:1"]
+        assert "a" in s
+
+    def test_invalid_shards(self):
+        """测试非法的分片数量。"""
+        with pytest.raises(ValueError):
+            RedisShardedSetStr(shards=0, redis_uri=REDIS_URI)
@@ -0,0 +1,504 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+from django_vises.logging.middleware import (
+    ASGIMiddlewareAccessLogging,
+    LogfireSampler,
+    render_prometheus_metrics,
+)
+
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def slow_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await asyncio.sleep(0.03)
+    await send({"type": "http.response.body", "body": b"a", "more_body": True})
+    await asyncio.sleep(0.03)
+    await send({"type": "http.response.body", "body": b"b"})
+
+
+def http_scope(path: str = "/", query_string: bytes = b"", headers=None) -> dict:
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query_string,
+        "headers": headers or [],
+        "client": ("127.0.0.1", 12345),
+    }
+
+
+async def echo_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    while True:
+        message = await receive()
+        await send(
+            {"type": "http.response.body", "body": message["body"], "more_body": True}
+        )
+        if not message.get("more_body"):
+            break
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def call(middleware, scope: dict, body: list[bytes] | None = None) -> list[dict]:
+    messages = list()
+    chunks = list(body or [b""])
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages
+
+
+class BlockingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = list()
+        self.durations = list()
+        self.sizes = list()
+        self.release = threading.Event()
+
+    def emit(self, record):
+        self.release.wait(5)
+        # 拆出末尾的耗时与字节数
+        message, duration, ttfb, *sizes = record.getMessage().rsplit(" ", 5)
+        self.records.append(message)
+        self.durations.append([duration, ttfb])
+        self.sizes.append(sizes)
+
+
+@pytest.fixture
+def asgi_logger():
+    logger = logging.getLogger("ASGI")
+    handler = BlockingHandler()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield handler
+    handler.release.set()
+    logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+
+
+class TestASGIMiddlewareAccessLogging:
+    async def test_sync(self, asgi_logger):
+        """测试同步模式下直接输出访问日志。"""
+        asgi_logger.release.set()
+        middleware = ASGIMiddlewareAccessLogging(app)
+        messages = await call(
+            middleware,
+            http_scope(
+                "/a", headers=[(b"x-forwarded-for", b"10.0.0.1")], query_string=b"b=1"
+            ),
+        )
+
+        assert messages[0]["status"] == 200
+        assert asgi_logger.records == ['10.0.0.1 - "GET /ab=1" 200']
+
+    async def test_queue(self, asgi_logger):
+        """测试队列模式下由后台线程输出, 不阻塞事件循环。"""
+        middleware = ASGIMiddlewareAccessLogging(app, log_mode="queue")
+        for i in range(3):
+            await call(middleware, http_scope(f"/{i}"))
+        # 日志输出被阻塞时请求仍然完成
+        assert asgi_logger.records == []
+
+        asgi_logger.release.set()
+        middleware.close()
+        assert asgi_logger.records == [
+            f'127.0.0.1:12345 - "GET /{i}" 200' for i in range(3)
+        ]
+        assert middleware.log_dropped == 0
+
+    @pytest.mark.parametrize(
+        "policy, expected", [("drop_newest", "/1"), ("drop_oldest", "/3")]
+    )
+    async def test_drop(self, asgi_logger, policy, expected):
+        """测试队列满时的丢弃策略。"""
+        middleware = ASGIMiddlewareAccessLogging(
+            app, log_mode="queue", log_queue_size=1, log_drop_policy=policy
+        )
+        # 第一条被后台线程取出并阻塞在输出中
+        await call(middleware, http_scope("/0"))
+        while not middleware._log_queue.empty():
+            await asyncio.sleep(0.01)
+        for i in range(1, 4):
+            await call(middleware, http_scope(f"/{i}"))
+
+        asgi_logger.release.set()
+        middleware.close()
+        assert middleware.log_dropped == 2
+        assert asgi_logger.records == [
+            '127.0.0.1:12345 - "GET /0" 200',
+            f'127.0.0.1:12345 - "GET {expected}" 200',
+        ]
+
+    async def test_non_http(self, asgi_logger):
+        """测试非 HTTP 请求直接交给应用, 不输出访问日志。"""
+        asgi_logger.release.set()
+        sends = list()
+
+        async def lifespan_app(scope, receive, send):
+            sends.append(send)
+
+        middleware = ASGIMiddlewareAccessLogging(lifespan_app)
+
+        async def send(message):
+            pass
+
+        await middleware({"type": "lifespan"}, None, send)
+        assert sends == [send]
+        assert asgi_logger.records == []
+
+    async def test_log_disabled(self, asgi_logger):
+        """测试日志级别过滤时不读取 headers。"""
+
+        class Headers:
+            def __iter__(self):
+                raise AssertionError("headers should not be scanned")
+
+        logging.getLogger("ASGI").setLevel(logging.WARNING)
+        middleware = ASGIMiddlewareAccessLogging(app)
+        messages = await call(middleware, {**http_scope(), "headers": Headers()})
+        assert messages[0]["status"] == 200
+        assert asgi_logger.records == []
+        assert middleware.latency_stats()["GET /"]["count"] == 1
+
+    def test_invalid_mode(self):
+        """测试不支持的模式。"""
+        with pytest.raises(ValueError):
+            ASGIMiddlewareAccessLogging(app, log_mode="async")  # type: ignore
+        with pytest.raises(ValueError):
+            ASGIMiddlewareAccessLogging(app, log_drop_policy="block")  # type: ignore
+
+    async def test_latency(self, asgi_logger):
+        """测试请求耗时、首字节时间与按路由的延迟直方图。"""
+        asgi_logger.release.set()
+        middleware = ASGIMiddlewareAccessLogging(slow_app)
+        await call(middleware, http_scope("/slow"))
+        await call(middleware, http_scope("/slow"))
+
+        duration, ttfb = asgi_logger.durations[0]
+        duration = float(duration.removesuffix("ms"))
+        ttfb = float(ttfb.removeprefix("ttfb=").removesuffix("ms"))
+        assert 25 <= ttfb < duration
+        assert duration >= 55
+
+        stats = middleware.latency_stats()
+        assert list(stats) == ["GET /slow"]
+        assert stats["GET /slow"]["count"] == 2
+        # 0.05 < duration <= 0.1
+        assert stats["GET /slow"]["counts"][4] == 2
+        assert stats["GET /slow"]["sum"] >= 0.11
+
+    async def test_app_error(self, asgi_logger):
+        """测试应用出错时按 500 记录并输出日志, 再抛出异常。"""
+        asgi_logger.release.set()
+
+        async def error_app(scope, receive, send):
+            raise ValueError
+
+        middleware = ASGIMiddlewareAccessLogging(error_app)
+        with pytest.raises(ValueError):
+            await call(middleware, {**http_scope("/error"), "route": "/error"})
+
+        assert asgi_logger.records == ['127.0.0.1:12345 - "GET /error" 500']
+        assert middleware.request_counts == {("GET", "/error", 500): 1}
+        assert middleware.latency_stats()["GET /error"]["count"] == 1
+
+    async def test_latency_route(self, asgi_logger):
+        """测试使用路由模板、折叠 ID 类路径段与路由数量上限。"""
+        asgi_logger.release.set()
+        middleware = ASGIMiddlewareAccessLogging(app)
+        middleware.route_limit = 3
+
+        class Route:
+            path = "/items/{item_id}"
+
+        for i in range(3):
+            await call(middleware, {**http_scope(f"/items/{i}"), "route": Route})
+        await call(middleware, http_scope("/users/42/orders/0123456789abcdef"))
+        await call(
+            middleware,
+            http_scope("/users/7/orders/550e8400-e29b-41d4-a716-446655440000"),
+        )
+        await call(middleware, http_scope("/a"))
+        await call(middleware, http_scope("/b"))
+
+        assert {
+            key: value["count"] for key, value in middleware.latency_stats().items()
+        } == {
+            "GET /items/{item_id}": 3,
+            "GET /users/{id}/orders/{id}": 2,
+            "GET /a": 1,
+            "GET other": 1,
+        }
+
+    async def test_unmatched_route(self, asgi_logger):
+        """测试未知路径的非 2xx 响应不占用路由数量。"""
+        asgi_logger.release.set()
+        status = 404
+
+        async def status_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": status, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = ASGIMiddlewareAccessLogging(status_app)
+        middleware.route_limit = 2
+        for path in ("/wp-login.php", "/.env", "/admin.php"):
+            await call(middleware, http_scope(path))
+
+        status = 200
+        await call(middleware, http_scope("/a"))
+        await call(
+            middleware,
+            {**http_scope("/articles/2024/"), "route": "articles/<int:year>/"},
+        )
+        # 已出现过的路径的非 2xx 响应仍按路由统计
+        status = 500
+        await call(middleware, http_scope("/a"))
+
+        assert middleware.request_counts == {
+            ("GET", "unmatched", 404): 3,
+            ("GET", "/a", 200): 1,
+            ("GET", "articles/<int:year>/", 200): 1,
+            ("GET", "/a", 500): 1,
+        }
+
+
+class TestBytes:
+    async def test_bytes(self, asgi_logger, monkeypatch):
+        """测试请求体与响应体的字节数、分块数与按路由的汇总。"""
+        asgi_logger.release.set()
+        events = list()
+        monkeypatch.setattr(
+            "logfire.info", lambda message, **attributes: events.append(attributes)
+        )
+        middleware = ASGIMiddlewareAccessLogging(echo_app)
+        middleware.logfire = True
+        await call(middleware, http_scope("/echo"), body=[b"abc", b"de"])
+        await call(middleware, http_scope("/echo"), body=[b"x" * 10])
+
+        assert asgi_logger.sizes == [
+            ["in=5B", "out=5B", "chunks=3"],
+            ["in=10B", "out=10B", "chunks=2"],
+        ]
+        assert events[0]["request_bytes"] == 5
+        assert events[0]["response_bytes"] == 5
+        assert events[0]["response_chunks"] == 3
+
+        assert middleware.bytes_stats() == {
+            "GET /echo": {
+                "count": 2,
+                "request_bytes": 15,
+                "response_bytes": 15,
+                "response_chunks": 5,
+                "max_response_bytes": 10,
+            }
+        }
+
+    async def test_metrics(self, asgi_logger, tmp_path):
+        """测试字节数汇总的输出与多进程合并。"""
+        asgi_logger.release.set()
+        middleware = ASGIMiddlewareAccessLogging(
+            echo_app, metrics_path="/metrics", metrics_dir=tmp_path
+        )
+        await call(middleware, http_scope("/echo"), body=[b"abc"])
+        other = ASGIMiddlewareAccessLogging(echo_app)
+        await call(other, http_scope("/echo"), body=[b"x" * 10])
+        tmp_path.joinpath("1.json").write_text(json.dumps(other.metrics_snapshot()))
+
+        assert middleware.collect_metrics()["bytes"]["GET /echo"] == {
+            "count": 2,
+            "request_bytes": 13,
+            "response_bytes": 13,
+            "response_chunks": 4,
+            "max_response_bytes": 10,
+        }
+        body = (await call(middleware, http_scope("/metrics")))[1]["body"].decode()
+        assert (
+            'http_response_body_bytes_total{method="GET",route="/echo"} 13'
+            in body.splitlines()
+        )
+        assert (
+            'http_request_body_bytes_total{method="GET",route="/echo"} 13'
+            in body.splitlines()
+        )
+
+
+class TestLogfireSampler:
+    def test_rate(self, monkeypatch):
+        """测试按比例采样。"""
+        values = iter([0.05, 0.5, 0.09, 0.95, 0.0])
+        monkeypatch.setattr("random.random", lambda: next(values))
+        sampler = LogfireSampler(rate=0.1)
+        assert [sampler.sample("/", 200, 0.01) for _ in range(4)] == [
+            True,
+            False,
+            True,
+            False,
+        ]
+        assert sampler.dropped == 2
+
+        assert not LogfireSampler(rate=0.0).sample("/", 200, 0.01)
+        with pytest.raises(ValueError):
+            LogfireSampler(rate=2)
+
+    def test_keep(self):
+        """测试总是保留 5xx 与慢请求。"""
+        sampler = LogfireSampler(rate=0.0, slow_threshold=1.0)
+        assert sampler.sample("/", 500, 0.01)
+        assert sampler.sample("/", 200, 1.5)
+        assert not sampler.sample("/", 404, 0.01)
+
+        assert not LogfireSampler(rate=0.0, keep_errors=False).sample("/", 500, 0.01)
+
+    def test_patterns(self):
+        """测试路径包含与排除规则。"""
+        sampler = LogfireSampler(include=["/api/*"], exclude=["/api/health"])
+        assert sampler.sample("/api/items", 200, 0.01)
+        assert not sampler.sample("/api/health", 500, 0.01)
+        assert not sampler.sample("/static/a.css", 500, 0.01)
+
+    def test_max_per_second(self, monkeypatch):
+        """测试每秒发送数量上限。"""
+        now = [100.0]
+        monkeypatch.setattr("time.monotonic", lambda: now[0])
+        sampler = LogfireSampler(max_per_second=2)
+        assert [sampler.sample("/", 500, 0.01) for _ in range(3)] == [
+            True,
+            True,
+            False,
+        ]
+        now[0] = 101.0
+        assert sampler.sample("/", 200, 0.01)
+        assert sampler.dropped == 1
+
+    async def test_middleware(self, asgi_logger, monkeypatch):
+        """测试中间件只发送采样保留的 logfire 事件。"""
+        asgi_logger.release.set()
+        events = list()
+        monkeypatch.setattr(
+            "logfire.info",
+            lambda message, **attributes: events.append((message, attributes)),
+        )
+        middleware = ASGIMiddlewareAccessLogging(
+            app, logfire_sampler=LogfireSampler(exclude=["/health"])
+        )
+        middleware.logfire = True
+        await call(middleware, http_scope("/health"))
+        await call(
+            middleware,
+            http_scope(
+                "/a",
+                headers=[
+                    (b"user-agent", b"curl/8.0"),
+                    (b"x-forwarded-for", b"10.0.0.1"),
+                ],
+            ),
+        )
+
+        assert len(events) == 1
+        message, attributes = events[0]
+        # 由 logfire 按属性填充, 路径中的 {} 不会被当作模板
+        assert message == "{remote_addr} {request_method} {request_path}"
+        assert attributes["request_path"] == "/a"
+        assert attributes["remote_addr"] == "10.0.0.1"
+        assert attributes["user_agent"] == "curl/8.0"
+        # 访问日志不受采样影响
+        assert len(asgi_logger.records) == 2
+
+
+class TestMetrics:
+    async def test_metrics_endpoint(self, asgi_logger):
+        """测试以 Prometheus 文本格式输出请求计数与延迟直方图。"""
+        asgi_logger.release.set()
+        middleware = ASGIMiddlewareAccessLogging(app, metrics_path="/metrics")
+        await call(middleware, http_scope("/items/1"))
+        await call(middleware, http_scope("/items/2"))
+
+        messages = await call(middleware, http_scope("/metrics"))
+        assert messages[0]["status"] == 200
+        body = messages[1]["body"].decode()
+        assert (
+            'http_requests_total{method="GET",route="/items/{id}",status="200"} 2'
+            in body.splitlines()
+        )
+        assert (
+            'http_request_duration_seconds_bucket{method="GET",route="/items/{id}",le="+Inf"} 2'
+            in body.splitlines()
+        )
+        assert (
+            'http_request_duration_seconds_count{method="GET",route="/items/{id}"} 2'
+            in body.splitlines()
+        )
+        # 输出统计的请求本身不计入
+        assert "/metrics" not in body
+        assert len(asgi_logger.records) == 2
+
+    async def test_metrics_disabled(self, asgi_logger):
+        """测试未设置 metrics_path 时交给应用处理。"""
+        asgi_logger.release.set()
+        middleware = ASGIMiddlewareAccessLogging(app)
+        messages = await call(middleware, http_scope("/metrics"))
+        assert messages[1]["body"] == b"ok"
+
+    async def test_multiprocess(self, asgi_logger, tmp_path, monkeypatch):
+        """测试多进程模式下由后台线程写入统计, 输出时合并各进程的统计。"""
+        asgi_logger.release.set()
+        monkeypatch.setattr(ASGIMiddlewareAccessLogging, "metrics_sync_interval", 0.05)
+        middleware = ASGIMiddlewareAccessLogging(
+            app, metrics_path="/metrics", metrics_dir=tmp_path
+        )
+        await call(middleware, http_scope("/a"))
+        path = tmp_path.joinpath(f"{os.getpid()}.json")
+        # 请求处理中不写文件
+        assert not path.exists()
+        await asyncio.sleep(0.2)
+        assert json.loads(path.read_text())["requests"] == [["GET", "/a", 200, 1]]
+
+        # 另一个进程的统计
+        other = ASGIMiddlewareAccessLogging(app)
+        await call(other, http_scope("/a"))
+        await call(other, http_scope("/b", headers=[]))
+        tmp_path.joinpath("1.json").write_text(json.dumps(other.metrics_snapshot()))
+
+        metrics = middleware.collect_metrics()
+        assert sorted(metrics["requests"]) == [
+            ["GET", "/a", 200, 2],
+            ["GET", "/b", 200, 1],
+        ]
+        assert sum(metrics["latency"]["GET /a"]["counts"]) == 2
+
+        body = (await call(middleware, http_scope("/metrics")))[1]["body"].decode()
+        assert (
+            'http_requests_total{method="GET",route="/a",status="200"} 2'
+            in body.splitlines()
+        )
+
+        await call(middleware, http_scope("/c"))
+        middleware.close()
+        assert ["GET", "/c", 200, 1] in json.loads(path.read_text())["requests"]
+
+    def test_label_escape(self):
+        """测试标签值转义。"""
+        body = render_prometheus_metrics(
+            {"requests": [["GET", '/a"b\\', 200, 1]], "latency": {}}, (0.1,)
+        )
+        assert 'route="/a\\"b\\\\"' in body